@@ -2,7 +2,8 @@ import argparse
 import os
 import yaml
 import copy
-from .runner import run_all
+from .runner import run_all, compact_history
+from .core import profiling
 
 from reddit_ideas import (
     get_reddit,
@@ -83,6 +84,13 @@ def add_reddit_ideas_parser(subparsers):
     reddit_parser.add_argument("--trending", action="store_true")
     reddit_parser.add_argument("--brand", type=str, help="Brand config profile name")
     reddit_parser.add_argument("--config", type=str, help="Explicit config file (YAML)")
+    add_profile_argument(reddit_parser)
+
+def add_profile_argument(parser):
+    parser.add_argument(
+        "--profile", nargs="?", const="data/profiles", metavar="DIR",
+        help="Write CPU (collapsed stacks), memory and asyncio profiles under DIR (default data/profiles)",
+    )
 
 def run_reddit_ideas(args):
     config = load_effective_config(args)
@@ -165,6 +173,18 @@ def main():
 
     scrape_parser = subparsers.add_parser("scrape", help="Scrape all configured sites")
     scrape_parser.add_argument("--site", default="all", help="Site name or 'all'")
+    scrape_parser.add_argument("--fresh", action="store_true", help="Ignore today's saved crawl state and start over")
+    scrape_parser.add_argument("--replay", metavar="SITE", help="Re-extract archived pages for SITE offline instead of crawling")
+    scrape_parser.add_argument("--date", help="Day to replay, YYYY-MM-DD or START..END (with --replay)")
+    add_profile_argument(scrape_parser)
+    scrape_parser.add_argument(
+        "--profile-inline-parse", action="store_true",
+        help="With --profile, parse in the main process so extraction appears in the CPU profile",
+    )
+
+    compact_parser = subparsers.add_parser("compact-history", help="Convert processed JSONL into the Parquet history store")
+    compact_parser.add_argument("--site", default="all", help="Site name or 'all'")
+    compact_parser.add_argument("--force", action="store_true", help="Rewrite days that are already up to date")
 
     # Register reddit-ideas command
     add_reddit_ideas_parser(subparsers)
@@ -172,9 +192,21 @@ def main():
     args = parser.parse_args()
 
     if args.command == "scrape":
-        run_all()
+        if args.replay and not args.date:
+            parser.error("--replay requires --date")
+        if args.profile_inline_parse and not args.profile:
+            parser.error("--profile-inline-parse requires --profile")
+        with profiling.session(args.profile, "replay" if args.replay else "scrape", inline_parse=args.profile_inline_parse):
+            if args.replay:
+                from .replay import replay
+                replay(args.replay, args.date)
+            else:
+                run_all(args.site, fresh=args.fresh)
+    elif args.command == "compact-history":
+        compact_history(args.site, force=args.force)
     elif args.command == "reddit-ideas":
-        run_reddit_ideas(args)
+        with profiling.session(args.profile, "reddit-ideas"):
+            run_reddit_ideas(args)
     else:
         parser.print_help()
 
@@ -1,5 +1,8 @@
+import asyncio
 from playwright.sync_api import sync_playwright, Browser, Page
-from typing import Optional
+from playwright.async_api import async_playwright, Browser as AsyncBrowser, BrowserContext, Page as AsyncPage, Route
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
 
 class BrowserManager:
     """
@@ -20,3 +23,127 @@ class BrowserManager:
             self._browser.close()
         if self._playwright:
             self._playwright.stop()
+
+
+DEFAULT_BROWSER = {
+    "pool_size": 2,
+    "max_navigations": 50,
+    "timeout_ms": 30000,
+    "wait_until": "domcontentloaded",
+    "block_resources": ["image", "font", "media"],
+    "block_third_party": False,
+}
+
+# Requests to these hosts never affect page content we extract.
+TRACKER_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "facebook.net",
+    "connect.facebook.com",
+    "hotjar.com",
+    "clarity.ms",
+    "segment.io",
+    "klaviyo.com",
+    "tiktok.com",
+    "bing.com",
+)
+
+_playwright = None
+_browser: Optional[AsyncBrowser] = None
+_launch_lock: Optional[asyncio.Lock] = None
+
+
+async def get_browser(headless: bool = True) -> AsyncBrowser:
+    """Return the process-wide Chromium instance, launching it on first use."""
+    global _playwright, _browser, _launch_lock
+    if _launch_lock is None:
+        _launch_lock = asyncio.Lock()
+    async with _launch_lock:
+        if _browser is None or not _browser.is_connected():
+            if _playwright is None:
+                _playwright = await async_playwright().start()
+            _browser = await _playwright.chromium.launch(headless=headless)
+    return _browser
+
+
+async def close_browser() -> None:
+    global _playwright, _browser, _launch_lock
+    if _browser is not None:
+        await _browser.close()
+        _browser = None
+    if _playwright is not None:
+        await _playwright.stop()
+        _playwright = None
+    _launch_lock = None
+
+
+def _host_matches(host: str, domains) -> bool:
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+
+class _Slot:
+    def __init__(self, context: BrowserContext, page: AsyncPage):
+        self.context = context
+        self.page = page
+        self.navigations = 0
+
+
+class PagePool:
+    """
+    Bounded pool of reusable pages on the shared browser for one site.
+
+    Each slot is its own context holding one page, with routing rules that
+    drop heavy resources and tracker requests. A slot is closed and replaced
+    after max_navigations, or after a failed navigation, to cap memory.
+    Settings come from the optional ``browser`` block of the site config.
+    """
+    def __init__(self, site_cfg: Dict[str, Any]):
+        self.site = site_cfg.get("name", "")
+        self.user_agent = site_cfg.get("user_agent", "Mozilla/5.0")
+        self.opts = {**DEFAULT_BROWSER, **(site_cfg.get("browser") or {})}
+        self._blocked_types = set(self.opts["block_resources"])
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(int(self.opts["pool_size"]))
+
+    async def _route(self, route: Route) -> None:
+        request = route.request
+        host = urlsplit(request.url).hostname or ""
+        if (
+            request.resource_type in self._blocked_types
+            or _host_matches(host, TRACKER_HOSTS)
+            or (self.opts["block_third_party"] and self.site and not _host_matches(host, [self.site]))
+        ):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _new_slot(self) -> _Slot:
+        browser = await get_browser()
+        context = await browser.new_context(user_agent=self.user_agent)
+        await context.route("**/*", self._route)
+        page = await context.new_page()
+        page.set_default_timeout(self.opts["timeout_ms"])
+        return _Slot(context, page)
+
+    async def fetch(self, url: str) -> Tuple[int, bytes, str]:
+        """Navigate a pooled page to url. Returns (status, content, final_url)."""
+        async with self._slots:
+            slot = self._idle.get_nowait() if not self._idle.empty() else await self._new_slot()
+            healthy = False
+            try:
+                resp = await slot.page.goto(url, wait_until=self.opts["wait_until"], timeout=self.opts["timeout_ms"])
+                html = await slot.page.content()
+                final_url = slot.page.url
+                healthy = True
+            finally:
+                slot.navigations += 1
+                if healthy and slot.navigations < self.opts["max_navigations"]:
+                    self._idle.put_nowait(slot)
+                else:
+                    await slot.context.close()
+        return (resp.status if resp else 0), html.encode(), final_url
+
+    async def aclose(self) -> None:
+        while not self._idle.empty():
+            await self._idle.get_nowait().context.close()
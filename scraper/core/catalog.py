@@ -1,5 +1,10 @@
 import csv
-from typing import List, Dict, Any
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from . import matching
+from .log import get_logger
+logger = get_logger("catalog")
 
 def load_catalog(filepath: str) -> List[Dict[str, Any]]:
     """
@@ -21,11 +26,13 @@ def save_catalog(rows: List[Dict[str, Any]], filepath: str) -> None:
         writer.writeheader()
         writer.writerows(rows)
 
-def price_delta_vs_catalog(sku: str, price: float, cat_map: list[dict]) -> float | None:
+def price_delta_vs_catalog(sku: str, price: float, cat_map: "Catalog | list[dict]") -> float | None:
     """
     Returns the price difference between the given price and the catalog price for the SKU.
     If SKU is not found or price is None, returns None.
     """
+    if isinstance(cat_map, Catalog):
+        return cat_map.price_delta(sku, price)
     if not sku or price is None:
         return None
     for row in cat_map:
@@ -36,3 +43,170 @@ def price_delta_vs_catalog(sku: str, price: float, cat_map: list[dict]) -> float
             except Exception:
                 return None
     return None
+
+
+def _parse_price(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        return float(str(value).replace("$", "").replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+class Catalog:
+    """
+    Indexed, lazily reloaded view of the catalog CSV.
+
+    Rows are indexed by normalised SKU, plus MPN and UPC when those columns
+    exist, with prices parsed once at load. The file is re-read only when its
+    mtime changes, so refresh() is cheap to call before every site.
+    """
+    SKU_COLUMNS = ("sku",)
+    MPN_COLUMNS = ("mpn", "manufacturer_part_number")
+    UPC_COLUMNS = ("upc", "gtin", "ean", "barcode")
+
+    def __init__(self, filepath: str, vendor_prefixes: Iterable[str] = (), min_title_score: float = 0.6):
+        self.filepath = filepath
+        self.min_title_score = min_title_score
+        self.vendor_prefixes = tuple(sorted((self._fold(p) for p in vendor_prefixes if p), key=len, reverse=True))
+        self.rows: List[Dict[str, Any]] = []
+        self.by_sku: Dict[str, int] = {}
+        self.by_mpn: Dict[str, int] = {}
+        self.by_upc: Dict[str, int] = {}
+        self.prices: List[Optional[float]] = []
+        self._matcher: Optional[matching.TitleMatcher] = None
+        self._mtime: Optional[float] = None
+        self.refresh()
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "Catalog":
+        return cls(
+            cfg.get("catalog_csv", ""),
+            cfg.get("catalog_vendor_prefixes") or (),
+            float(cfg.get("catalog_min_title_score", 0.6)),
+        )
+
+    @staticmethod
+    def _fold(value: str) -> str:
+        return "".join(str(value).split()).upper()
+
+    def normalize(self, code: Optional[str]) -> str:
+        """Fold case and whitespace, then strip one known vendor prefix."""
+        if not code:
+            return ""
+        folded = self._fold(code)
+        for prefix in self.vendor_prefixes:
+            if folded.startswith(prefix) and len(folded) > len(prefix):
+                return folded[len(prefix):]
+        return folded
+
+    def refresh(self) -> bool:
+        """Reload the CSV if its mtime changed. Returns True when it was reloaded."""
+        try:
+            mtime = os.path.getmtime(self.filepath)
+        except OSError:
+            if self._mtime is None:
+                logger.warning(f"catalog not found: {self.filepath!r}")
+                self._mtime = -1.0
+            return False
+        if mtime == self._mtime:
+            return False
+        self._load(load_catalog(self.filepath))
+        self._mtime = mtime
+        return True
+
+    def _load(self, rows: List[Dict[str, Any]]) -> None:
+        self.rows = rows
+        columns = {c.lower(): c for c in (rows[0].keys() if rows else [])}
+        price_col = columns.get("price", "price")
+        self.prices = [_parse_price(r.get(price_col)) for r in rows]
+        self.by_sku = self._index(rows, columns, self.SKU_COLUMNS)
+        self.by_mpn = self._index(rows, columns, self.MPN_COLUMNS)
+        self.by_upc = self._index(rows, columns, self.UPC_COLUMNS)
+        self._title_col = columns.get("title") or columns.get("name")
+        self._matcher = None
+
+    def _index(self, rows: List[Dict[str, Any]], columns: Dict[str, str], names: Tuple[str, ...]) -> Dict[str, int]:
+        index: Dict[str, int] = {}
+        for name in names:
+            col = columns.get(name)
+            if col is None:
+                continue
+            for i, row in enumerate(rows):
+                key = self.normalize(row.get(col))
+                if key:
+                    index.setdefault(key, i)  # first row wins, like the old linear scan
+        return index
+
+    def find(self, code: Optional[str]) -> Optional[int]:
+        """Row index for a scraped code, trying SKU, then MPN, then UPC."""
+        key = self.normalize(code)
+        if not key:
+            return None
+        for index in (self.by_sku, self.by_mpn, self.by_upc):
+            i = index.get(key)
+            if i is not None:
+                return i
+        return None
+
+    def lookup(self, code: Optional[str]) -> Optional[Dict[str, Any]]:
+        i = self.find(code)
+        return self.rows[i] if i is not None else None
+
+    def price_delta(self, sku: Optional[str], price: Optional[float]) -> Optional[float]:
+        if not sku or price is None:
+            return None
+        i = self.find(sku)
+        if i is None or self.prices[i] is None:
+            return None
+        return price - self.prices[i]
+
+    @property
+    def title_matcher(self) -> Optional[matching.TitleMatcher]:
+        """N-gram TF-IDF index over catalog titles, built on first use."""
+        if self._matcher is None and self.rows and self._title_col:
+            if not matching.available():
+                return None
+            self._matcher = matching.TitleMatcher([r.get(self._title_col) or "" for r in self.rows])
+        return self._matcher
+
+    def annotate(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Fills catalog_sku, catalog_match_method/score and price_delta_vs_catalog
+        on product dicts in place. Exact code matches come first; the rest are
+        title-matched as one batch when the catalog has a title column.
+        """
+        unmatched = []
+        for row in rows:
+            i = self.find(row.get("sku"))
+            if i is not None:
+                self._apply(row, i, "sku", 1.0)
+            elif row.get("title"):
+                unmatched.append(row)
+        matcher = self.title_matcher if unmatched else None
+        if matcher is None:
+            return
+        for row, (i, score) in zip(unmatched, matcher.match([r["title"] for r in unmatched])):
+            if i is not None and score >= self.min_title_score:
+                self._apply(row, i, "title", round(score, 4))
+
+    def _apply(self, row: Dict[str, Any], i: int, method: str, score: float) -> None:
+        sku_col = next((c for c in self.rows[i] if c.lower() == "sku"), None)
+        row["catalog_sku"] = self.rows[i].get(sku_col) if sku_col else None
+        row["catalog_match_method"] = method
+        row["catalog_match_score"] = score
+        price = row.get("price")
+        row["price_delta_vs_catalog"] = price - self.prices[i] if price is not None and self.prices[i] is not None else None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+def annotate_rows(rows: List[Dict[str, Any]], cat_map: "Catalog | list[dict]") -> None:
+    """Attach catalog matches and price deltas to product dicts in place."""
+    if isinstance(cat_map, Catalog):
+        cat_map.annotate(rows)
+        return
+    for row in rows:
+        row["price_delta_vs_catalog"] = price_delta_vs_catalog(row.get("sku"), row.get("price"), cat_map)
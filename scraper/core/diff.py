@@ -1,6 +1,15 @@
 # diff.py
 import difflib
-from typing import List, Dict, Any
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import orjson
+
+from ..models import make_dedupe_key
+from .log import get_logger
+from .storage import JsonlWriter, read_jsonl
+logger = get_logger("diff")
 
 def compute_diff(a: List[str], b: List[str]) -> List[str]:
     """Compute a unified diff between two lists of strings."""
@@ -46,3 +55,146 @@ def diff_lists(old_list: List[Dict[str, Any]], new_list: List[Dict[str, Any]], k
         else:
             diffs.append({'key': k, 'diff': 'added'})
     return diffs
+
+
+# Fields compared when a product's hash changed between two days.
+TRACKED_FIELDS = ("title", "price", "currency", "sku", "in_stock", "stock_text", "images", "rating", "reviews_count", "categories")
+STAT_KEYS = ("new", "gone", "changed", "unchanged", "price_up", "price_down", "back_in_stock", "out_of_stock")
+
+
+def _row_key(row: Dict[str, Any]) -> str:
+    return make_dedupe_key(row.get("site", ""), row.get("sku"), row.get("url", ""))
+
+
+def _index_jsonl(path: Path) -> Dict[str, Tuple[Optional[str], int]]:
+    """Map dedupe key -> (hash, byte offset) for each row; the first row for a key wins, as in diff_products."""
+    index: Dict[str, Tuple[Optional[str], int]] = {}
+    with Path(path).open("rb") as f:
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                row = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                break  # truncated tail of an interrupted write
+            index.setdefault(_row_key(row), (row.get("hash"), offset))
+    return index
+
+
+def diff_products(
+    prev_path: Path,
+    cur_path: Path,
+    on_change: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, int]:
+    """
+    Compares two days of processed products matched by Product.dedupe_key().
+
+    The previous day is indexed as key -> (hash, offset) only, and the current
+    day is streamed against it. Rows whose hash is unchanged are skipped
+    without field comparison; otherwise the old row is read back by offset.
+    Memory therefore grows with the number of keys, not with record size.
+    When a key appears more than once in a day, its first row is used on both sides.
+    on_change receives one record per new, gone or changed product.
+    Returns counts for STAT_KEYS.
+    """
+    stats = dict.fromkeys(STAT_KEYS, 0)
+    emit = on_change or (lambda change: None)
+    index = _index_jsonl(prev_path)
+    seen = set()
+    with Path(prev_path).open("rb") as prev_f:
+        for row in read_jsonl(cur_path):
+            key = _row_key(row)
+            if key in seen:
+                continue
+            seen.add(key)
+            entry = index.pop(key, None)
+            if entry is None:
+                stats["new"] += 1
+                emit({"key": key, "url": row.get("url"), "type": "new"})
+                continue
+            old_hash, offset = entry
+            if old_hash is not None and old_hash == row.get("hash"):
+                stats["unchanged"] += 1
+                continue
+            prev_f.seek(offset)
+            old = orjson.loads(prev_f.readline())
+            fields = {
+                k: {"old": old.get(k), "new": row.get(k)}
+                for k in TRACKED_FIELDS
+                if old.get(k) != row.get(k)
+            }
+            if not fields:
+                stats["unchanged"] += 1
+                continue
+            stats["changed"] += 1
+            old_price, new_price = old.get("price"), row.get("price")
+            if old_price is not None and new_price is not None:
+                if new_price > old_price:
+                    stats["price_up"] += 1
+                elif new_price < old_price:
+                    stats["price_down"] += 1
+            if old.get("in_stock") is False and row.get("in_stock") is True:
+                stats["back_in_stock"] += 1
+            elif old.get("in_stock") is True and row.get("in_stock") is False:
+                stats["out_of_stock"] += 1
+            emit({"key": key, "url": row.get("url"), "type": "changed", "fields": fields})
+        for key, (_, offset) in index.items():
+            prev_f.seek(offset)
+            old = orjson.loads(prev_f.readline())
+            stats["gone"] += 1
+            emit({"key": key, "url": old.get("url"), "type": "gone"})
+    return stats
+
+
+def _site_value(path: Path) -> Optional[str]:
+    for row in read_jsonl(path):
+        return row.get("site")
+    return None
+
+
+def write_diff_outputs(site: str, date: str, prev_path: Path, cur_path: Path, root: str = "data/diffs") -> Dict[str, int]:
+    """
+    Diffs cur_path against prev_path and writes data/diffs/{site}/{date}.json
+    (stats, as read by scripts/summarize_to_gdoc.py) plus one change record
+    per line in {date}.changes.jsonl. Returns the stats.
+
+    Dedupe keys start with the row's site value, so when that changed between
+    the two days (as when adapters switched from a placeholder to the
+    configured site name) every product would show as gone and new again.
+    Such a day is not diffed: the stats are all zero and the payload says why.
+    """
+    out_dir = Path(root) / site
+    out_dir.mkdir(parents=True, exist_ok=True)
+    changes_path = out_dir / f"{date}.changes.jsonl"
+    prev_site, cur_site = _site_value(prev_path), _site_value(cur_path)
+    if prev_site is not None and cur_site is not None and prev_site != cur_site:
+        changes_path.unlink(missing_ok=True)
+        logger.warning(f"{site}: rows changed site from {prev_site!r} to {cur_site!r}; not diffing {date} against {Path(prev_path).stem}")
+        payload = {
+            "site": site,
+            "date": date,
+            "previous": Path(prev_path).stem,
+            "stats": dict.fromkeys(STAT_KEYS, 0),
+            "changes_file": None,
+            "skipped": f"site value changed from {prev_site!r} to {cur_site!r}; keys are not comparable",
+        }
+        (out_dir / f"{date}.json").write_bytes(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+        return payload["stats"]
+    tmp_path = changes_path.with_suffix(".tmp")
+    tmp_path.unlink(missing_ok=True)
+    with JsonlWriter(tmp_path, batch_size=500) as writer:
+        stats = diff_products(prev_path, cur_path, writer.write)
+    os.replace(tmp_path, changes_path)
+    payload = {
+        "site": site,
+        "date": date,
+        "previous": Path(prev_path).stem,
+        "stats": stats,
+        "changes_file": changes_path.name,
+    }
+    (out_dir / f"{date}.json").write_bytes(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+    return stats
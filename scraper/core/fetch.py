@@ -1,13 +1,30 @@
 import requests
 from typing import Optional, Dict, Any
 
+import asyncio
+import contextlib
 import httpx
 import time
-from typing import Tuple
+from typing import AsyncIterator, Awaitable, Callable, List, Tuple
 import os
+import importlib.util
+from urllib.parse import urlsplit
+from . import metrics
 from .log import get_logger
+from .rate_limit import AdaptiveConcurrency, HostRateLimiter, OVERLOAD_STATUSES, parse_retry_after
+from .retry import RetryPolicy
+from .robots import RobotsCache, RobotsDisallowed
 logger = get_logger("fetch")
 
+DEFAULT_HTTP = {
+    "http2": False,
+    "max_connections": 10,
+    "max_keepalive_connections": 10,
+    "keepalive_expiry_s": 30.0,
+    "timeout_s": 10.0,
+    "max_retry_after_s": 600.0,
+}
+
 def fetch_url(url: str, headers: Optional[Dict[str, str]] = None, timeout: int = 10) -> Optional[str]:
     """
     Fetches the content of a URL. Returns the text if successful, else None.
@@ -19,30 +36,183 @@ def fetch_url(url: str, headers: Optional[Dict[str, str]] = None, timeout: int =
     except Exception:
         return None
 
-def fetch_httpx(
-    url: str,
-    user_agent: str,
-    proxy: Optional[str] = None,
-    timeout: httpx.Timeout = None
-) -> Tuple[int, bytes, str]:
-    """Fetch a URL over HTTP using httpx. Returns (status, content, final_url)."""
-    def allowed(url, user_agent):
-        return True
-    class RobotsDisallowed(Exception):
-        pass
-    DEFAULT_HEADERS = {}
-    DEFAULT_TIMEOUT = httpx.Timeout(10.0)
-    if timeout is None:
-        timeout = DEFAULT_TIMEOUT
-    if not allowed(url, user_agent):
-        raise RobotsDisallowed(f"robots.txt disallows {url}")
-    headers = dict(DEFAULT_HEADERS)
-    headers["User-Agent"] = user_agent
-    proxy_arg = proxy or os.getenv("HTTPS_PROXY") or os.getenv("HTTP_PROXY")
-    t0 = time.time()
-    with httpx.Client(timeout=timeout, headers=headers, follow_redirects=True, proxy=proxy_arg) as client:
-        resp = client.get(url)
-        elapsed = int((time.time() - t0) * 1000)
-        logger.info("fetched via httpx", extra={"url": url, "status": resp.status_code, "elapsed_ms": elapsed})
-        resp.raise_for_status()
-        return resp.status_code, resp.content, str(resp.url)
+
+class FetchError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class FetchEngine:
+    """
+    Long-lived async HTTP engine for one site.
+
+    Holds a single pooled httpx.AsyncClient so keep-alive connections (and
+    HTTP/2 streams, when enabled) are reused across every request to the site.
+    Settings come from the optional ``http`` block of the site config.
+    """
+    def __init__(
+        self,
+        site_cfg: Dict[str, Any],
+        proxy: Optional[str] = None,
+        budget: Optional[asyncio.Semaphore] = None,
+        limiter: Optional[HostRateLimiter] = None,
+        robots: Optional[RobotsCache] = None,
+    ):
+        self.site = site_cfg.get("name", "")
+        self.limiter = limiter or HostRateLimiter.from_site_config(site_cfg)
+        self.gate = AdaptiveConcurrency.from_site_config(site_cfg)
+        self.retry = RetryPolicy.from_site_config(site_cfg)
+        self.robots = robots
+        # Shared across sites by the runner to cap in-flight requests globally.
+        self.budget = budget
+        self.user_agent = site_cfg.get("user_agent", "Mozilla/5.0")
+        self.http_cfg = {**DEFAULT_HTTP, **(site_cfg.get("http") or {})}
+        self.proxy = proxy or os.getenv("HTTPS_PROXY") or os.getenv("HTTP_PROXY")
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        http2 = bool(self.http_cfg["http2"])
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("http2 requested but the 'h2' package is not installed; using HTTP/1.1")
+            http2 = False
+        limits = httpx.Limits(
+            max_connections=self.http_cfg["max_connections"],
+            max_keepalive_connections=self.http_cfg["max_keepalive_connections"],
+            keepalive_expiry=self.http_cfg["keepalive_expiry_s"],
+        )
+        return httpx.AsyncClient(
+            headers={"User-Agent": self.user_agent},
+            timeout=httpx.Timeout(self.http_cfg["timeout_s"]),
+            limits=limits,
+            http2=http2,
+            follow_redirects=True,
+            proxy=self.proxy,
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so the client binds to the loop that first uses it.
+        if self._client is None:
+            self._client = self._build_client()
+        return self._client
+
+    async def _check_robots(self, url: str) -> None:
+        if self.robots is None:
+            return
+        rules = await self.robots.get(self.client, url, self.user_agent, self.retry)
+        if not rules.can_fetch(url):
+            raise RobotsDisallowed(f"robots.txt disallows {url}")
+        self.limiter.use_robots(urlsplit(url).netloc, rules)
+
+    async def sitemaps(self, url: str) -> List[str]:
+        """Sitemap URLs listed in robots.txt for url's origin; empty when robots are not consulted."""
+        if self.robots is None:
+            return []
+        rules = await self.robots.get(self.client, url, self.user_agent, self.retry)
+        return list(rules.sitemaps)
+
+    def _honour_retry_after(self, url: str, status: int, headers) -> None:
+        if status not in OVERLOAD_STATUSES:
+            return
+        delay = parse_retry_after(headers.get("Retry-After"))
+        if delay:
+            delay = min(delay, float(self.http_cfg["max_retry_after_s"]))
+            logger.warning(f"{url}: HTTP {status}, holding off {urlsplit(url).netloc} for {delay:.0f}s (Retry-After)")
+            self.limiter.defer(url, delay)
+
+    @contextlib.asynccontextmanager
+    async def stream(self, url: str) -> AsyncIterator[httpx.Response]:
+        """
+        Streaming GET under the same robots, rate-limit, budget and retry
+        handling as fetch(). Yields the open response so large bodies can be
+        consumed incrementally; its slots are held until the block exits.
+        Opening the response is retried; errors while reading it are not.
+        """
+        await self._check_robots(url)
+        stack, resp = await self.retry.call(url, lambda: self._open_stream(url))
+        async with stack:
+            yield resp
+
+    async def _open_stream(self, url: str) -> Tuple[contextlib.AsyncExitStack, httpx.Response]:
+        # One attempt. On success everything the open response holds is handed
+        # to the caller on a fresh stack; on failure it is all released here.
+        async with contextlib.AsyncExitStack() as stack:
+            outcome = await stack.enter_async_context(self.gate.slot(url))
+            waited = await self.limiter.acquire(url)
+            metrics.observe("rate_limit_wait_seconds", waited, site=self.site)
+            await stack.enter_async_context(self.budget or contextlib.nullcontext())
+            t0 = time.perf_counter()
+            stack.callback(lambda: metrics.observe("fetch_seconds", time.perf_counter() - t0, site=self.site))
+            try:
+                resp = await stack.enter_async_context(
+                    self.client.stream("GET", url, extensions={"trace": metrics.RequestTrace(self.site)})
+                )
+            except httpx.TransportError as e:
+                metrics.inc("fetch_errors", site=self.site, error=type(e).__name__)
+                raise
+            # Only what was actually read; a probe may abandon the body early.
+            stack.callback(lambda: metrics.inc("fetch_bytes", resp.num_bytes_downloaded, site=self.site))
+            logger.info("streaming via httpx", extra={"url": url, "status": resp.status_code, "wait_ms": int(waited * 1000)})
+            metrics.inc("fetch_requests", site=self.site, status=resp.status_code)
+            outcome.status = resp.status_code
+            self._honour_retry_after(url, resp.status_code, resp.headers)
+            resp.raise_for_status()
+            return stack.pop_all(), resp
+
+    async def fetch(self, url: str, via: Optional[Callable[[str], Awaitable[Tuple[int, bytes, str]]]] = None) -> Tuple[int, bytes, str]:
+        """
+        Fetch a URL through the pooled client. Returns (status, content, final_url).
+        `via` swaps in another transport, such as a browser PagePool.fetch, that
+        still goes through robots, rate-limit and budget checks. Transient
+        failures are retried with backoff; while the host's circuit breaker is
+        open this raises CircuitOpen without sending anything.
+        """
+        await self._check_robots(url)
+        return await self.retry.call(url, lambda: self._fetch_once(url, via))
+
+    async def _fetch_once(self, url: str, via) -> Tuple[int, bytes, str]:
+        # The host's concurrency slot comes first, then its rate-limit slot, so
+        # queued requests see a Retry-After deferral from one that just finished.
+        # Both before a share of the global budget.
+        async with self.gate.slot(url) as outcome:
+            waited = await self.limiter.acquire(url)
+            metrics.observe("rate_limit_wait_seconds", waited, site=self.site)
+            async with self.budget or contextlib.nullcontext():
+                t0 = time.monotonic()
+                try:
+                    if via is None:
+                        resp = await self.client.get(url, extensions={"trace": metrics.RequestTrace(self.site)})
+                        status, content, final_url = resp.status_code, resp.content, str(resp.url)
+                        self._honour_retry_after(url, status, resp.headers)
+                    else:
+                        status, content, final_url = await via(url)
+                except Exception as e:
+                    metrics.inc("fetch_errors", site=self.site, error=type(e).__name__)
+                    raise
+                finally:
+                    metrics.observe("fetch_seconds", time.monotonic() - t0, site=self.site)
+            outcome.status = status
+        metrics.inc("fetch_requests", site=self.site, status=status)
+        metrics.inc("fetch_bytes", len(content), site=self.site)
+        elapsed = int((time.monotonic() - t0) * 1000)
+        logger.info(
+            "fetched via " + ("httpx" if via is None else "browser"),
+            extra={"url": url, "status": status, "elapsed_ms": elapsed, "wait_ms": int(waited * 1000)},
+        )
+        if via is None:
+            resp.raise_for_status()
+        elif status >= 400:
+            raise FetchError(f"HTTP {status} for {url}", status)
+        return status, content, final_url
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
@@ -0,0 +1,104 @@
+# frontier.py
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+DISCOVERED = "discovered"
+FETCHED = "fetched"
+PARSED = "parsed"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class Frontier:
+    """
+    Durable crawl state for one site and day, stored in
+    data/state/{site}/{date}.sqlite.
+
+    Tracks every discovered URL through fetched -> parsed (or failed, or
+    skipped when a probe shows it is not a product) so a restarted run can
+    skip discovery and the URLs already written or skipped today.
+    State changes are committed in step with the JSONL writer's flushes: a
+    URL is only recorded as parsed once its row is on disk.
+    """
+    def __init__(self, site: str, date: str, root: str = "data/state"):
+        self.path = Path(root) / site / f"{date}.sqlite"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS urls_state ON urls(state, seq);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self.conn.commit()
+
+    def reset(self) -> None:
+        self.conn.execute("DELETE FROM urls")
+        self.conn.execute("DELETE FROM meta")
+        self.conn.commit()
+
+    def discovery_done(self) -> bool:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'discovery_done'").fetchone()
+        return bool(row and row[0] == "1")
+
+    def add_discovered(self, urls: Iterable[str], complete: bool = True) -> None:
+        """Record urls in discovery order; already-known urls keep their state."""
+        start = self.conn.execute("SELECT COALESCE(MAX(seq) + 1, 0) FROM urls").fetchone()[0]
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO urls (url, seq, state, updated_at) VALUES (?, ?, ?, ?)",
+            ((u, start + i, DISCOVERED, now) for i, u in enumerate(urls)),
+        )
+        if complete:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('discovery_done', '1')")
+        self.conn.commit()
+
+    def urls(self, exclude_state: Optional[str] = None) -> List[str]:
+        """All known urls in discovery order, optionally skipping one state."""
+        if exclude_state is None:
+            rows = self.conn.execute("SELECT url FROM urls ORDER BY seq")
+        else:
+            rows = self.conn.execute("SELECT url FROM urls WHERE state != ? ORDER BY seq", (exclude_state,))
+        return [r[0] for r in rows]
+
+    def pending(self) -> List[str]:
+        """Urls not yet parsed or skipped today, including earlier failures, in discovery order."""
+        rows = self.conn.execute("SELECT url FROM urls WHERE state NOT IN (?, ?) ORDER BY seq", (PARSED, SKIPPED))
+        return [r[0] for r in rows]
+
+    def failed(self) -> List[str]:
+        rows = self.conn.execute("SELECT url FROM urls WHERE state = ? ORDER BY seq", (FAILED,))
+        return [r[0] for r in rows]
+
+    def mark(self, url: str, state: str, error: Optional[str] = None) -> None:
+        """Stage a state change; it becomes durable on the next commit()."""
+        if state == FAILED:
+            self.conn.execute(
+                "UPDATE urls SET state = ?, error = ?, attempts = attempts + 1, updated_at = ? WHERE url = ?",
+                (state, error, time.time(), url),
+            )
+        else:
+            self.conn.execute(
+                "UPDATE urls SET state = ?, error = NULL, updated_at = ? WHERE url = ?",
+                (state, time.time(), url),
+            )
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self.conn.execute("SELECT state, COUNT(*) FROM urls GROUP BY state").fetchall())
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,201 @@
+# history.py
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from .log import get_logger
+from .storage import read_jsonl
+logger = get_logger("history")
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # the JSONL files remain the source of truth without pyarrow
+    pa = pc = ds = pq = None
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def _schema():
+    # site and date are partition columns, encoded in the directory names.
+    return pa.schema([
+        ("url", pa.string()),
+        ("title", pa.string()),
+        ("price", pa.float64()),
+        ("currency", pa.string()),
+        ("sku", pa.string()),
+        ("images", pa.list_(pa.string())),
+        ("in_stock", pa.bool_()),
+        ("stock_text", pa.string()),
+        ("reviews_count", pa.int64()),
+        ("rating", pa.float64()),
+        ("categories", pa.list_(pa.string())),
+        ("captured_at", pa.string()),
+        ("hash", pa.string()),
+        ("price_delta_vs_catalog", pa.float64()),
+        ("catalog_sku", pa.string()),
+        ("catalog_match_method", pa.string()),
+        ("catalog_match_score", pa.float64()),
+    ])
+
+
+def _partitioning():
+    return ds.partitioning(pa.schema([("site", pa.string()), ("date", pa.string())]), flavor="hive")
+
+
+class History:
+    """
+    Columnar product history: one Parquet file per site and day under
+    {root}/site={site}/date={date}/part-0.parquet.
+
+    Rows are sorted by SKU inside each file, so row-group statistics let a
+    SKU filter skip most of every file. Queries go through a pyarrow dataset,
+    which prunes site/date partitions from the directory names and reads
+    only the requested columns.
+    """
+    def __init__(self, root: str = "data/history", row_group_size: int = 8192):
+        if not available():
+            raise RuntimeError("History requires pyarrow")
+        self.root = Path(root)
+        self.row_group_size = row_group_size
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any] | None) -> Optional["History"]:
+        """A History for the config's ``history`` block, or None if disabled or pyarrow is missing."""
+        cfg = cfg or {}
+        if not cfg.get("enabled", True):
+            return None
+        if not available():
+            logger.warning("history enabled but pyarrow is not installed; skipping Parquet output")
+            return None
+        return cls(cfg.get("root", "data/history"))
+
+    def partition_path(self, site: str, date: str) -> Path:
+        return self.root / f"site={site}" / f"date={date}" / "part-0.parquet"
+
+    def write_day(self, site: str, date: str, jsonl: Path) -> int:
+        """
+        Convert one day's processed JSONL into its partition, replacing any
+        earlier copy. Returns rows written. Rows are converted to Arrow a
+        row group at a time, so only one batch is held as Python dicts.
+        Blocking; the runner calls it through asyncio.to_thread.
+        """
+        schema = _schema()
+        names = schema.names
+        batches = []
+        rows: List[Dict[str, Any]] = []
+        for row in read_jsonl(jsonl):
+            rows.append({k: row.get(k) for k in names})
+            if len(rows) >= self.row_group_size:
+                batches.append(pa.RecordBatch.from_pylist(rows, schema=schema))
+                rows = []
+        if rows:
+            batches.append(pa.RecordBatch.from_pylist(rows, schema=schema))
+        table = pa.Table.from_batches(batches, schema=schema)
+        if table.num_rows:
+            table = table.sort_by([("sku", "ascending"), ("url", "ascending")])
+        path = self.partition_path(site, date)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".parquet.tmp")
+        pq.write_table(table, tmp, row_group_size=self.row_group_size, compression="zstd")
+        os.replace(tmp, path)
+        return table.num_rows
+
+    def compact(self, processed_root: str = "data/processed", sites: Optional[Iterable[str]] = None, force: bool = False) -> int:
+        """
+        Backfill partitions from processed JSONL. Days whose partition is newer
+        than the JSONL are skipped unless force is set. Returns days written.
+        """
+        base = Path(processed_root)
+        wanted = set(sites) if sites else None
+        written = 0
+        for jsonl in sorted(base.glob("*/*.jsonl")):
+            site, date = jsonl.parent.name, jsonl.stem
+            if wanted is not None and site not in wanted:
+                continue
+            path = self.partition_path(site, date)
+            if not force and path.exists() and path.stat().st_mtime >= jsonl.stat().st_mtime:
+                continue
+            n = self.write_day(site, date, jsonl)
+            logger.info(f"{site} {date}: {n} rows")
+            written += 1
+        return written
+
+    def dataset(self):
+        return ds.dataset(self.root, format="parquet", partitioning=_partitioning())
+
+    def _filter(self, site: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None):
+        expr = None
+        for cond in (
+            ds.field("site") == site if site else None,
+            ds.field("date") >= start if start else None,
+            ds.field("date") <= end if end else None,
+        ):
+            if cond is not None:
+                expr = cond if expr is None else expr & cond
+        return expr
+
+    def read(self, columns: List[str], filter=None) -> "pa.Table":
+        if not self.root.exists():
+            return pa.table({c: [] for c in columns})
+        return self.dataset().to_table(columns=columns, filter=filter)
+
+    def dates(self, site: str) -> List[str]:
+        """Days stored for a site, from the partition directories alone."""
+        site_dir = self.root / f"site={site}"
+        if not site_dir.exists():
+            return []
+        return sorted(p.name.split("=", 1)[1] for p in site_dir.glob("date=*") if (p / "part-0.parquet").exists())
+
+    def price_series(self, sku: str, site: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Daily price and availability for one SKU, oldest first."""
+        expr = ds.field("sku") == sku
+        extra = self._filter(site, start, end)
+        if extra is not None:
+            expr = expr & extra
+        table = self.read(["site", "date", "price", "in_stock", "url"], expr)
+        return table.sort_by([("date", "ascending"), ("site", "ascending")]).to_pylist()
+
+    def daily_aggregates(self, site: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Per site and day: product count, priced and in-stock counts, and min/mean/max price."""
+        table = self.read(["site", "date", "price", "in_stock"], self._filter(site, start, end))
+        table = table.append_column("priced", pc.is_valid(table["price"]))
+        grouped = table.group_by(["site", "date"]).aggregate([
+            ([], "count_all"),
+            ("priced", "sum"),
+            ("in_stock", "sum"),
+            ("price", "min"),
+            ("price", "mean"),
+            ("price", "max"),
+        ])
+        out = []
+        for row in grouped.sort_by([("site", "ascending"), ("date", "ascending")]).to_pylist():
+            out.append({
+                "site": row["site"],
+                "date": row["date"],
+                "products": row["count_all"],
+                "priced": row["priced_sum"] or 0,
+                "in_stock": row["in_stock_sum"] or 0,
+                "price_min": row["price_min"],
+                "price_mean": row["price_mean"],
+                "price_max": row["price_max"],
+            })
+        return out
+
+    def latest(self, site: str, columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Rows of the most recent day stored for a site."""
+        days = self.dates(site)
+        if not days:
+            return []
+        return pq.read_table(self.partition_path(site, days[-1]), columns=columns).to_pylist()
+
+    def count(self, site: str, date: str) -> Optional[int]:
+        """Row count from Parquet metadata, without reading any data; None if the day is not stored."""
+        path = self.partition_path(site, date)
+        if not path.exists():
+            return None
+        return pq.ParquetFile(path).metadata.num_rows
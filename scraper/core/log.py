@@ -1,13 +1,31 @@
 import logging
 import sys
 
+# Attributes every LogRecord has; anything else was passed through `extra=`.
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class ExtraFormatter(logging.Formatter):
+    """
+    Formatter that appends a record's `extra=` fields as key=value pairs,
+    which the stock format string silently drops.
+    """
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        # formatMessage rather than format, so extras come before any traceback.
+        line = super().formatMessage(record)
+        extras = {k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS}
+        if extras:
+            line += " " + " ".join(f"{k}={v}" for k, v in extras.items())
+        return line
+
+
+_handler = logging.StreamHandler(sys.stdout)
+_handler.setFormatter(ExtraFormatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s'))
+
 # Configure the root logger
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
+    handlers=[_handler]
 )
 
 def get_logger(name: str) -> logging.Logger:
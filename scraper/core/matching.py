@@ -0,0 +1,134 @@
+# matching.py
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # title matching is skipped without numpy/scipy
+    np = None
+    sparse = None
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def available() -> bool:
+    return np is not None and sparse is not None
+
+
+def char_ngrams(text: str, n: int = 3) -> Counter:
+    """Character n-gram counts of a lowercased, punctuation-folded title."""
+    norm = " " + _NON_ALNUM.sub(" ", (text or "").lower()).strip() + " "
+    if len(norm) <= 2:
+        return Counter()
+    return Counter(norm[i:i + n] for i in range(max(1, len(norm) - n + 1)))
+
+
+class TitleMatcher:
+    """
+    TF-IDF index over character n-grams of catalog titles.
+
+    The catalog side is built once as an L2-normalised sparse matrix.
+    match() vectorises a whole batch of scraped titles the same way and scores
+    it against every catalog row with one sparse matrix product, so the cost
+    is a few array operations per chunk rather than a Python loop per pair.
+    N-grams found in more than max_df of catalog titles carry little signal
+    and are dropped. Only each title's query_grams rarest n-grams generate
+    candidates, which keeps the product matrix sparse at 50k+ catalog rows.
+    """
+    def __init__(
+        self,
+        titles: Sequence[str],
+        n: int = 3,
+        max_df: float = 0.05,
+        query_grams: int = 12,
+        chunk_size: int = 2048,
+    ):
+        if not available():
+            raise RuntimeError("TitleMatcher requires numpy and scipy")
+        self.n = n
+        self.query_grams = query_grams
+        self.chunk_size = chunk_size
+        grams = [char_ngrams(t, n) for t in titles]
+        df: Counter = Counter()
+        for g in grams:
+            df.update(g.keys())
+        n_docs = max(1, len(titles))
+        limit = max(1, int(max_df * n_docs)) if n_docs >= 20 else n_docs
+        self.vocab: Dict[str, int] = {}
+        idf: List[float] = []
+        for gram, count in df.items():
+            if count <= limit:
+                self.vocab[gram] = len(idf)
+                idf.append(math.log((1 + n_docs) / (1 + count)) + 1.0)
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.matrix = self._to_matrix(grams)
+        # Transposed once here: match() runs per parse batch, and rebuilding
+        # this for a large catalog costs far more than scoring a batch.
+        self._catalog_t = self.matrix.T.tocsr()
+
+    def _to_matrix(self, grams: List[Counter]):
+        indptr = [0]
+        indices: List[int] = []
+        data: List[float] = []
+        vocab = self.vocab
+        for g in grams:
+            for gram, count in g.items():
+                col = vocab.get(gram)
+                if col is not None:
+                    indices.append(col)
+                    data.append(count)
+            indptr.append(len(indices))
+        m = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(grams), len(self.vocab)),
+        )
+        m = m.multiply(self.idf).tocsr()
+        norms = np.sqrt(np.asarray(m.multiply(m).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sparse.diags(1.0 / norms).dot(m).tocsr()
+
+    def _top_grams(self, q):
+        """Keep each row's k highest-weighted (rarest) n-grams; the rest only add candidates."""
+        counts = np.diff(q.indptr)
+        if not len(q.data) or counts.max() <= self.query_grams:
+            return q
+        row_ids = np.repeat(np.arange(q.shape[0]), counts)
+        order = np.lexsort((-q.data, row_ids))
+        rank = np.arange(len(order)) - q.indptr[row_ids[order]]
+        keep = np.sort(order[rank < self.query_grams])
+        kept_rows = row_ids[keep]
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(kept_rows, minlength=q.shape[0]))))
+        return sparse.csr_matrix((q.data[keep], q.indices[keep], indptr), shape=q.shape)
+
+    def match(self, titles: Sequence[str]) -> List[Tuple[Optional[int], float]]:
+        """
+        Best catalog row index and cosine score for each title; (None, 0.0) if
+        nothing overlaps. Candidates come from each title's rarest n-grams, and
+        the winner is re-scored against the title's full vector.
+        """
+        out: List[Tuple[Optional[int], float]] = []
+        for start in range(0, len(titles), self.chunk_size):
+            chunk = titles[start:start + self.chunk_size]
+            q = self._to_matrix([char_ngrams(t, self.n) for t in chunk])
+            scores = (self._top_grams(q) @ self._catalog_t).tocsr()
+            best = np.full(len(chunk), -1, dtype=np.int64)
+            best_score = np.zeros(len(chunk), dtype=np.float32)
+            if scores.nnz:
+                counts = np.diff(scores.indptr)
+                row_ids = np.repeat(np.arange(len(chunk)), counts)
+                row_max = np.zeros(len(chunk), dtype=scores.data.dtype)
+                row_max[counts > 0] = np.maximum.reduceat(scores.data, scores.indptr[:-1][counts > 0])
+                hits = np.flatnonzero(scores.data == row_max[row_ids])
+                _, first = np.unique(row_ids[hits], return_index=True)
+                pos = hits[first]
+                rows = row_ids[pos]
+                best[rows] = scores.indices[pos]
+                best_score[rows] = np.asarray(q[rows].multiply(self.matrix[best[rows]]).sum(axis=1)).ravel()
+            out.extend(
+                (int(b), float(s)) if b >= 0 else (None, 0.0)
+                for b, s in zip(best, best_score)
+            )
+        return out
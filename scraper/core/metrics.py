@@ -0,0 +1,222 @@
+# metrics.py
+import bisect
+import contextlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# Counters and latency histograms for the scrape pipeline. Everything records
+# into the module-level REGISTRY; the runner resets it at the start of a run
+# and writes it out as a JSON report (and optionally a Prometheus textfile)
+# at the end. Labels are keyword arguments, e.g. inc("fetch_requests", site=s, status=200).
+
+# Latency buckets in seconds, 1ms to 2min.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram. Quantiles are estimated by linear
+    interpolation inside the bucket that holds them, which is accurate to the
+    bucket width; min and max are exact.
+    """
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lo = BUCKETS[i - 1] if i > 0 else 0.0
+                hi = BUCKETS[i] if i < len(BUCKETS) else self.max
+                est = lo + (hi - lo) * (rank - seen) / n
+                return min(max(est, self.min), self.max)
+            seen += n
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "mean": round(self.total / self.count, 6),
+            "min": round(self.min, 6),
+            "p50": round(self.quantile(0.5), 6),
+            "p90": round(self.quantile(0.9), 6),
+            "p99": round(self.quantile(0.99), 6),
+            "max": round(self.max, 6),
+        }
+
+
+class Metrics:
+    """
+    In-process registry of labelled counters and histograms.
+
+    All recording happens on the event loop thread (parse timings are measured
+    in the worker and reported back with the batch), so no locking is needed.
+    """
+    def __init__(self, prefix: str = "scraper"):
+        self.prefix = prefix
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.started = time.time()
+
+    def reset(self) -> None:
+        self.counters.clear()
+        self.histograms.clear()
+        self.started = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        series = self.counters.setdefault(name, {})
+        key = _key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        series = self.histograms.setdefault(name, {})
+        key = _key(labels)
+        hist = series.get(key)
+        if hist is None:
+            hist = series[key] = Histogram()
+        hist.observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def report(self, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """JSON-ready snapshot: counters and histogram summaries, one entry per label set."""
+        out: Dict[str, Any] = {
+            "started_at": self.started,
+            "finished_at": time.time(),
+            "counters": {
+                name: [{"labels": dict(k), "value": v} for k, v in sorted(series.items())]
+                for name, series in sorted(self.counters.items())
+            },
+            "histograms": {
+                name: [{"labels": dict(k), **h.summary()} for k, h in sorted(series.items())]
+                for name, series in sorted(self.histograms.items())
+            },
+        }
+        if extra:
+            out.update(extra)
+        return out
+
+    def write_json(self, path: Path, extra: Optional[Dict[str, Any]] = None) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.report(extra), indent=2), encoding="utf-8")
+
+    def prometheus_text(self) -> str:
+        """Prometheus exposition format, for node_exporter's textfile collector."""
+        def fmt(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = key + extra
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            metric = f"{self.prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.extend(f"{metric}{fmt(k)} {_number(v)}" for k, v in sorted(series.items()))
+        for name, series in sorted(self.histograms.items()):
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for k, h in sorted(series.items()):
+                running = 0
+                for le, n in zip(BUCKETS + (float("inf"),), h.counts):
+                    running += n
+                    lines.append(f"{metric}_bucket{fmt(k, (('le', '+Inf' if le == float('inf') else f'{le:g}'),))} {running}")
+                lines.append(f"{metric}_sum{fmt(k)} {h.total:.6f}")
+                lines.append(f"{metric}_count{fmt(k)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Path) -> None:
+        # Written then renamed so the collector never reads a partial file.
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(self.prometheus_text(), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = Metrics()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+
+
+class RequestTrace:
+    """
+    httpx ``trace`` extension callback that splits one request into phases:
+    connect (TCP, including DNS resolution, which httpcore does not report
+    separately), tls, ttfb (request sent to response headers received) and
+    download (response body). Phases that did not happen, such as connect on
+    a reused keep-alive connection, are not recorded.
+    """
+    PHASES = {
+        "connect_tcp": "connect",
+        "start_tls": "tls",
+        "receive_response_body": "download",
+    }
+
+    def __init__(self, site: str, registry: Metrics = REGISTRY):
+        self.site = site
+        self.registry = registry
+        self._started: Dict[str, float] = {}
+
+    async def __call__(self, event: str, info: Dict[str, Any]) -> None:
+        # Events look like "connection.connect_tcp.started" or "http11.send_request_headers.started".
+        _, _, rest = event.partition(".")
+        step, _, edge = rest.rpartition(".")
+        now = time.perf_counter()
+        if step == "send_request_headers" and edge == "started":
+            self._started["ttfb"] = now
+        elif step == "receive_response_headers" and edge == "complete":
+            self._record("ttfb", now)
+        elif step in self.PHASES:
+            phase = self.PHASES[step]
+            if edge == "started":
+                self._started[phase] = now
+            elif edge in ("complete", "failed"):
+                self._record(phase, now)
+
+    def _record(self, phase: str, now: float) -> None:
+        t0 = self._started.pop(phase, None)
+        if t0 is not None:
+            self.registry.observe(f"fetch_{phase}_seconds", now - t0, site=self.site)
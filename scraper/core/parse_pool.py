@@ -0,0 +1,139 @@
+# parse_pool.py
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from . import metrics
+
+# Adapters built inside a worker process, keyed by site name. They survive
+# between batches so each worker compiles a site's extraction plan only once.
+_ADAPTERS: Dict[str, Any] = {}
+
+
+def _adapter_for(site_cfg: Dict[str, Any]):
+    adapter = _ADAPTERS.get(site_cfg["name"])
+    if adapter is None:
+        from ..runner import load_adapter_class
+        adapter = load_adapter_class(site_cfg)(site_cfg)
+        _ADAPTERS[site_cfg["name"]] = adapter
+    return adapter
+
+
+# RawStores opened inside a worker process for replay, keyed by site name.
+_STORES: Dict[str, Any] = {}
+
+
+def _store_for(site_cfg: Dict[str, Any]):
+    store = _STORES.get(site_cfg["name"])
+    if store is None:
+        from .storage import RawStore
+        store = RawStore.from_config(site_cfg["name"], site_cfg.get("raw_store"))
+        _STORES[site_cfg["name"]] = store
+    return store
+
+
+def read_stored(site_cfg: Dict[str, Any], ref: Tuple[str, str]) -> bytes:
+    """Load an archived page: ("blob", sha256) from the RawStore, or ("file", path) for legacy raw files."""
+    kind, value = ref
+    if kind == "blob":
+        return _store_for(site_cfg).get(value)
+    with open(value, "rb") as f:
+        return f.read()
+
+
+class ParseError(Exception):
+    """Stands in for the row of a page that could not be read or parsed; the rest of its batch is kept."""
+    def __init__(self, url: str, message: str):
+        super().__init__(url, message)
+        self.url = url
+        self.message = message
+
+
+Row = Union[Dict[str, Any], ParseError]
+
+
+def _parse_pages(site_cfg: Dict[str, Any], items: list, load: Callable[[Any], bytes]) -> List[Row]:
+    adapter = _adapter_for(site_cfg)
+    rows: List[Row] = []
+    for url, item in items:
+        try:
+            prod = adapter.parse_product(load(item).decode("utf-8", errors="replace"))
+            prod.url = url
+            rows.append(prod.dict())
+        except Exception as e:
+            rows.append(ParseError(url, repr(e)))
+    return rows
+
+
+def parse_batch(site_cfg: Dict[str, Any], pages: List[Tuple[str, bytes]]) -> List[Row]:
+    """
+    Parses (url, html bytes) pairs with the site's adapter and returns product
+    dicts, with a ParseError in place of each page that raised.
+    Runs inside a worker process, or inline when the stage has no pool.
+    """
+    return _parse_pages(site_cfg, pages, lambda content: content)
+
+
+def parse_stored_batch(site_cfg: Dict[str, Any], refs: List[Tuple[str, Tuple[str, str]]]) -> List[Row]:
+    """Like parse_batch, but each worker reads the pages itself so no HTML crosses the process boundary."""
+    return _parse_pages(site_cfg, refs, lambda ref: read_stored(site_cfg, ref))
+
+
+def _timed(fn, *args):
+    # Measured where the work runs, so the time excludes pickling and pool queueing.
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - t0
+
+
+class ParseStage:
+    """
+    CPU-bound parse stage backed by a ProcessPoolExecutor.
+
+    Pages are submitted in batches of batch_size to amortise pickling, and
+    max_pending bounds how many batches may be queued or running at once.
+    With workers=0 batches are parsed inline on the calling thread.
+    """
+    def __init__(self, workers: Optional[int] = None, batch_size: int = 16, max_pending: Optional[int] = None):
+        """
+        :param workers: Worker processes; None means os.cpu_count(), 0 disables the pool.
+        :param batch_size: Pages per submitted batch.
+        :param max_pending: Batches allowed in flight; defaults to twice the worker count.
+        """
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.batch_size = max(1, batch_size)
+        self.max_pending = max_pending or max(1, 2 * self.workers)
+        self._executor = ProcessPoolExecutor(self.workers) if self.workers > 0 else None
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "ParseStage":
+        return cls(cfg.get("parse_workers"), int(cfg.get("parse_batch_size", 16)))
+
+    async def _run(self, fn, site_cfg: Dict[str, Any], items: list):
+        t0 = time.perf_counter()
+        if self._executor is None:
+            rows, busy = _timed(fn, site_cfg, items)
+        else:
+            loop = asyncio.get_running_loop()
+            rows, busy = await loop.run_in_executor(self._executor, _timed, fn, site_cfg, items)
+        site = site_cfg["name"]
+        metrics.observe("parse_batch_seconds", busy, site=site)
+        metrics.observe("parse_wait_seconds", time.perf_counter() - t0 - busy, site=site)
+        errors = sum(isinstance(r, ParseError) for r in rows)
+        metrics.inc("parsed_pages", len(rows) - errors, site=site)
+        if errors:
+            metrics.inc("parse_errors", errors, site=site)
+        return rows
+
+    async def parse(self, site_cfg: Dict[str, Any], pages: List[Tuple[str, bytes]]) -> List[Row]:
+        return await self._run(parse_batch, site_cfg, pages)
+
+    async def parse_stored(self, site_cfg: Dict[str, Any], refs: List[Tuple[str, Tuple[str, str]]]) -> List[Row]:
+        return await self._run(parse_stored_batch, site_cfg, refs)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
@@ -4,6 +4,11 @@ from typing import Any, List, Dict
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # BeautifulSoup alone still works, just slower
+    LexborHTMLParser = None
+
 class HTMLParser:
     def __init__(self, html: str):
         self.soup = BeautifulSoup(html, "html.parser")
@@ -32,49 +37,101 @@ def filter_rows(rows: List[Dict[str, Any]], **criteria) -> List[Dict[str, Any]]:
         return all(row.get(k) == v for k, v in criteria.items())
     return [row for row in rows if matches(row)]
 
+def _dedupe(values: List[str]) -> List[str]:
+    seen = set()
+    out = []
+    for v in values:
+        if v not in seen:
+            seen.add(v)
+            out.append(v)
+    return out
+
+def _lexbor_attrs(tree, selector: str, attr: str, base_url: str | None) -> List[str]:
+    out = []
+    for node in tree.css(selector):
+        v = node.attributes.get(attr)
+        if v:
+            out.append(urljoin(base_url, v) if base_url else v)
+    return out
+
+def _soup_attrs(soup, selector: str, attr: str, base_url: str | None) -> List[str]:
+    out = []
+    for el in soup.select(selector):
+        v = el.get(attr)
+        if v:
+            out.append(urljoin(base_url, v) if base_url else v)
+    return out
+
+def _lexbor_text(tree, selector: str) -> str | None:
+    node = tree.css_first(selector)
+    return node.text(strip=True) if node is not None else None
+
+def _soup_text(soup, selector: str) -> str | None:
+    el = soup.select_one(selector)
+    return el.get_text(strip=True) if el else None
+
 def all_attr(html: str, selector: str, attr: str, base_url: str | None = None) -> list[str]:
     """Return all values of a given attribute from elements matching selector.
     Resolves relative URLs if base_url is provided.
     """
-    out: list[str] = []
     if not selector or not attr:
-        return out
-    try:
-        tree = HTMLParser(html)
-        for n in tree.select(selector):
-            v = n.get(attr) if hasattr(n, 'get') else n.attributes.get(attr)
-            if v:
-                if base_url:
-                    v = urljoin(base_url, v)
-                out.append(v)
-    except Exception:
-        soup = BeautifulSoup(html, "html.parser")
-        for el in soup.select(selector):
-            v = el.get(attr)
-            if v:
-                if base_url:
-                    v = urljoin(base_url, v)
-                out.append(v)
-    # Dedupe while preserving order
-    seen = set()
-    deduped = []
-    for v in out:
-        if v not in seen:
-            seen.add(v)
-            deduped.append(v)
-    return deduped
+        return []
+    if LexborHTMLParser is not None:
+        try:
+            return _dedupe(_lexbor_attrs(LexborHTMLParser(html), selector, attr, base_url))
+        except Exception:
+            pass
+    return _dedupe(_soup_attrs(BeautifulSoup(html, "html.parser"), selector, attr, base_url))
 
 def first_text(html: str, selector: str) -> str | None:
     """Return the stripped text of the first element matching selector, or None."""
     if not selector:
         return None
-    try:
-        tree = HTMLParser(html)
-        node = tree.select(selector)
-        if node:
-            return node[0].get_text(strip=True)
-    except Exception:
-        pass
-    soup = BeautifulSoup(html, "html.parser")
-    el = soup.select_one(selector)
-    return el.get_text(strip=True) if el else None
+    if LexborHTMLParser is not None:
+        try:
+            return _lexbor_text(LexborHTMLParser(html), selector)
+        except Exception:
+            pass
+    return _soup_text(BeautifulSoup(html, "html.parser"), selector)
+
+
+class ExtractionPlan:
+    """
+    Extraction compiled once from a site's ``selectors`` block.
+
+    extract() parses the document a single time with selectolax and pulls every
+    configured field out of that tree. BeautifulSoup is only used when
+    selectolax is unavailable or rejects a selector.
+    """
+    TEXT_FIELDS = ("title", "price", "sku", "in_stock", "categories", "rating", "reviews_count")
+    ATTR_FIELDS = {"images": "src"}
+
+    def __init__(self, selectors: Dict[str, Any]):
+        selectors = selectors or {}
+        self.text_fields = {f: selectors[f] for f in self.TEXT_FIELDS if selectors.get(f)}
+        self.attr_fields = {f: (selectors[f], attr) for f, attr in self.ATTR_FIELDS.items() if selectors.get(f)}
+
+    def _empty(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {f: None for f in self.TEXT_FIELDS}
+        out.update({f: [] for f in self.ATTR_FIELDS})
+        return out
+
+    def extract(self, html: str, base_url: str | None = None) -> Dict[str, Any]:
+        """Return a dict with one value per field: text (or None) and attribute lists."""
+        out = self._empty()
+        if LexborHTMLParser is not None:
+            try:
+                tree = LexborHTMLParser(html)
+                for f, sel in self.text_fields.items():
+                    out[f] = _lexbor_text(tree, sel)
+                for f, (sel, attr) in self.attr_fields.items():
+                    out[f] = _dedupe(_lexbor_attrs(tree, sel, attr, base_url))
+                return out
+            except Exception:
+                out = self._empty()
+        soup = BeautifulSoup(html, "html.parser")
+        for f, sel in self.text_fields.items():
+            out[f] = _soup_text(soup, sel)
+        for f, (sel, attr) in self.attr_fields.items():
+            out[f] = _dedupe(_soup_attrs(soup, sel, attr, base_url))
+        return out
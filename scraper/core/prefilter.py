@@ -0,0 +1,166 @@
+# prefilter.py
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from .log import get_logger
+from .storage import read_jsonl
+logger = get_logger("prefilter")
+
+# Pages that are never products on any storefront.
+DEFAULT_EXCLUDES = (
+    r"^https?://privacy\.",
+    r"/(privacy|privacy-policy|terms|terms-of-service|legal|cookies?|policies|account|login|cart|checkout"
+    r"|search|contact|blogs?|news|careers)(/|$|\?)",
+)
+
+# Markers in <head> that identify a product page.
+DEFAULT_MARKERS = (
+    rb"\"@type\"\s*:\s*\[?\s*\"Product\"",
+    rb"property=[\"']og:type[\"'][^>]*content=[\"']product",
+    rb"content=[\"']product[\"'][^>]*property=[\"']og:type",
+    rb"itemtype=[\"']https?://schema\.org/Product[\"']",
+    rb"property=[\"'](?:product|og):price:amount",
+)
+
+_HEAD_END = re.compile(rb"</head\s*>|<body[\s>]", re.I)
+
+
+class NotAProduct(Exception):
+    """Raised by a probed fetch whose <head> carries no product markers."""
+
+
+def url_shape(url: str) -> str:
+    """Host plus path template: digits folded and the last segment wildcarded."""
+    parts = urlsplit(url)
+    segs = [s for s in parts.path.split("/") if s]
+    if segs:
+        segs[-1] = "*"
+    return parts.netloc + "/" + "/".join(re.sub(r"\d+", "0", s) for s in segs)
+
+
+def _yielded(row: Dict[str, Any]) -> bool:
+    return row.get("price") is not None or bool(row.get("sku"))
+
+
+class Prefilter:
+    """
+    Per-site filter applied between discovery and fetch.
+
+    Drops URLs matching exclude rules (DEFAULT_EXCLUDES plus the site's own),
+    URLs missing every include rule when any are given, and URLs the site's
+    recent processed JSONL says never yield a product: exact URLs seen at
+    least min_samples times with no price or SKU, and URL shapes (see
+    url_shape) with min_samples or more rows and no yield at all. Learning is
+    skipped for a site whose history has no yielding rows, since that points
+    to missing selectors rather than non-product pages.
+    """
+    def __init__(
+        self,
+        include: Iterable[str] = (),
+        exclude: Iterable[str] = (),
+        default_excludes: bool = True,
+        dead_urls: Optional[Set[str]] = None,
+        dead_shapes: Optional[Set[str]] = None,
+    ):
+        self.include = [re.compile(p) for p in include]
+        self.exclude = [re.compile(p, re.I) for p in (*(DEFAULT_EXCLUDES if default_excludes else ()), *exclude)]
+        self.dead_urls = dead_urls or set()
+        self.dead_shapes = dead_shapes or set()
+
+    @classmethod
+    def from_site_config(cls, site_cfg: Dict[str, Any], today: str, root: str = "data/processed") -> "Prefilter":
+        cfg = site_cfg.get("prefilter") or {}
+        dead_urls, dead_shapes = learn(
+            Path(root) / site_cfg["name"], today, int(cfg.get("learn_days", 7)), int(cfg.get("min_samples", 3))
+        )
+        return cls(cfg.get("include", ()), cfg.get("exclude", ()), bool(cfg.get("default_excludes", True)), dead_urls, dead_shapes)
+
+    def reason(self, url: str) -> Optional[str]:
+        """Why url should be skipped, or None to fetch it."""
+        if self.include and not any(p.search(url) for p in self.include):
+            return "include"
+        if any(p.search(url) for p in self.exclude):
+            return "exclude"
+        if url in self.dead_urls:
+            return "learned-url"
+        if url_shape(url) in self.dead_shapes:
+            return "learned-shape"
+        return None
+
+    def filter(self, urls: List[str]) -> Tuple[List[str], Counter]:
+        """Returns (urls to fetch, counts of skipped urls per reason)."""
+        keep: List[str] = []
+        skipped: Counter = Counter()
+        for url in urls:
+            why = self.reason(url)
+            if why is None:
+                keep.append(url)
+            else:
+                skipped[why] += 1
+        return keep, skipped
+
+
+def learn(site_dir: Path, today: str, days: int, min_samples: int) -> Tuple[Set[str], Set[str]]:
+    """Scan up to `days` processed JSONL files before today for URLs and shapes that never yield."""
+    if days <= 0 or not site_dir.exists():
+        return set(), set()
+    files = sorted(p for p in site_dir.glob("*.jsonl") if p.stem < today)[-days:]
+    url_seen: Counter = Counter()
+    url_hits: Set[str] = set()
+    shape_seen: Counter = Counter()
+    shape_hits: Set[str] = set()
+    for path in files:
+        for row in read_jsonl(path):
+            url = row.get("url")
+            if not url:
+                continue
+            shape = url_shape(url)
+            url_seen[url] += 1
+            shape_seen[shape] += 1
+            if _yielded(row):
+                url_hits.add(url)
+                shape_hits.add(shape)
+    if not url_hits:
+        return set(), set()
+    dead_urls = {u for u, n in url_seen.items() if n >= min_samples and u not in url_hits}
+    dead_shapes = {s for s, n in shape_seen.items() if n >= min_samples and s not in shape_hits}
+    return dead_urls, dead_shapes
+
+
+class ProductProbe:
+    """
+    Decides from the start of a streamed response whether it is a product page.
+
+    check() returns True once a marker appears, False once <head> has closed
+    without one, and None while undecided. Storefront heads can run to
+    hundreds of KB of inline scripts, so responses still undecided after
+    max_bytes are treated as products and fetched in full.
+    """
+    # Re-scan this much of the previous chunk so markers split across chunks are found.
+    OVERLAP = 512
+
+    def __init__(self, markers: Iterable[bytes] = DEFAULT_MARKERS, max_bytes: int = 1 << 20):
+        self.markers = [re.compile(m, re.I) for m in markers]
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_site_config(cls, site_cfg: Dict[str, Any]) -> Optional["ProductProbe"]:
+        cfg = site_cfg.get("prefilter") or {}
+        if not cfg.get("probe"):
+            return None
+        markers = [m.encode() for m in cfg.get("probe_markers", ())] or DEFAULT_MARKERS
+        return cls(markers, int(cfg.get("probe_max_bytes", 1 << 20)))
+
+    def check(self, head: bytes, start: int = 0) -> Optional[bool]:
+        """Classify head; bytes before `start` were already checked by an earlier call."""
+        pos = max(0, start - self.OVERLAP)
+        end = _HEAD_END.search(head, pos)
+        stop = end.start() if end else len(head)
+        if any(m.search(head, pos, stop) for m in self.markers):
+            return True
+        if end is not None:
+            return False
+        return True if len(head) >= self.max_bytes else None
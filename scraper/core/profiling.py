@@ -0,0 +1,323 @@
+# profiling.py
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+
+# The Profiler for the current --profile run, if any. The runner checks this
+# to instrument its event loop; everything else is unaffected.
+_ACTIVE: Optional["Profiler"] = None
+
+# Callback timing replaces asyncio.events.Handle._run, and samples are
+# attributed to tasks through asyncio.tasks._current_tasks. Both are CPython
+# internals, so each is used only on versions where it is known to work and
+# the attribute is actually there; otherwise that part of the profile is off.
+_KNOWN_VERSIONS = (3, 8) <= sys.version_info[:2] <= (3, 13)
+_HANDLE_RUN_OK = _KNOWN_VERSIONS and callable(getattr(getattr(asyncio.events, "Handle", None), "_run", None))
+_CURRENT_TASKS = getattr(asyncio.tasks, "_current_tasks", None) if _KNOWN_VERSIONS else None
+
+
+def active() -> Optional["Profiler"]:
+    return _ACTIVE
+
+
+def inline_parse() -> bool:
+    """Whether the profiled run should parse in-process (--profile-inline-parse)."""
+    return _ACTIVE is not None and _ACTIVE.inline_parse
+
+
+@functools.lru_cache(maxsize=4096)
+def _short(filename: str) -> str:
+    for marker in ("site-packages" + os.sep, os.getcwd() + os.sep):
+        i = filename.find(marker)
+        if i >= 0:
+            return filename[i + len(marker):]
+    return os.path.basename(filename)
+
+
+class Profiler:
+    """
+    Whole-run profiler behind the CLI's --profile flag.
+
+    A background thread samples the main thread's stack every `interval`
+    seconds and attributes each sample to the asyncio task that was running,
+    so concurrent sites get separate subtrees; stage costs (discovery, fetch,
+    parse, catalog, storage, diff) show up as the functions under each site.
+    tracemalloc runs alongside and the snapshot nearest peak traced memory is
+    kept. While the runner's loop is attached, every callback the loop runs is
+    timed so ones slower than `slow_callback_s` (which block every site) are
+    logged, and a monitor task records event loop lag and task counts.
+    asyncio's own debug mode does the same but captures a stack for every
+    call_soon, which distorts the profile far more than what it measures.
+    Callback timing and per-task labels rely on asyncio internals and are
+    skipped, with a note in summary.json, on Pythons where those are missing.
+
+    Only this process is sampled. With a parse pool, extraction runs in the
+    workers and appears here as waiting on them; `inline_parse` asks the
+    runner to parse in-process instead, which profiles extraction but no
+    longer matches the production workload.
+
+    Output in out_dir:
+      cpu.collapsed     sampled stacks, "root;frame;...;frame count", for flamegraph.pl or speedscope
+      memory.collapsed  allocations live at peak, "frame;...;frame bytes"
+      memory_top.txt    largest allocation sites at peak
+      asyncio.log       callbacks that blocked the loop longer than slow_callback_s
+      summary.json      samples per site, peak memory, loop lag and task counts
+    """
+    def __init__(
+        self,
+        out_dir: Path,
+        name: str,
+        interval: float = 0.005,
+        memory_frames: int = 16,
+        slow_callback_s: float = 0.1,
+        inline_parse: bool = False,
+    ):
+        self.out_dir = Path(out_dir)
+        self.inline_parse = inline_parse
+        self.name = name
+        self.interval = interval
+        self.memory_frames = memory_frames
+        self.slow_callback_s = slow_callback_s
+        self.samples: Counter = Counter()
+        self.timeline: List[Dict[str, Any]] = []
+        self.slow_callbacks = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._main_id = threading.main_thread().ident
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._root_task: Optional[asyncio.Task] = None
+        # Child task -> label of the site task that (transitively) created it.
+        self._task_labels: "weakref.WeakKeyDictionary[asyncio.Task, str]" = weakref.WeakKeyDictionary()
+        self._peak_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._peak_traced = 0
+        self._slow_log = None
+        self._frame_names: Dict[Any, str] = {}
+        self._t0 = 0.0
+
+    # -- sampling ---------------------------------------------------------
+
+    def _label(self) -> str:
+        loop = self._loop
+        if loop is None or _CURRENT_TASKS is None:
+            return self.name
+        # Read from another thread; a stale answer only misattributes one sample.
+        task = _CURRENT_TASKS.get(loop)
+        if task is None:
+            return "(event loop)"
+        return self._task_labels.get(task) or task.get_name()
+
+    def _sample(self) -> None:
+        next_mem = 0.0
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._main_id)
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    name = self._frame_names.get(code)
+                    if name is None:
+                        name = self._frame_names[code] = f"{code.co_name} ({_short(code.co_filename)}:{code.co_firstlineno})"
+                    stack.append(name)
+                    frame = frame.f_back
+                stack.append(self._label())
+                self.samples[tuple(reversed(stack))] += 1
+                del frame
+            now = time.monotonic()
+            if now >= next_mem:
+                next_mem = now + 1.0
+                self._check_memory()
+
+    def _check_memory(self) -> None:
+        current, _ = tracemalloc.get_traced_memory()
+        # Re-snapshot only on a new high, so the kept snapshot is close to peak.
+        if current > self._peak_traced * 1.1:
+            self._peak_traced = current
+            self._peak_snapshot = tracemalloc.take_snapshot()
+
+    # -- event loop -------------------------------------------------------
+
+    def _task_factory(self, loop, coro, **kwargs):
+        task = asyncio.Task(coro, loop=loop, **kwargs)
+        parent = asyncio.current_task(loop)
+        # Site tasks are created by the root task and named after their site;
+        # everything they spawn (fetch workers, parse batches) inherits that name.
+        if parent is not None and parent is not self._root_task:
+            self._task_labels[task] = self._task_labels.get(parent) or parent.get_name()
+        return task
+
+    async def _monitor(self, loop: asyncio.AbstractEventLoop, every: float = 0.5) -> None:
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(every)
+            lag = max(0.0, loop.time() - t0 - every)
+            self.timeline.append({
+                "t": round(time.monotonic() - self._t0, 2),
+                "tasks": len(asyncio.all_tasks(loop)),
+                "lag_ms": round(lag * 1000, 1),
+            })
+
+    def _timed_handle_run(self, run):
+        profiler = self
+
+        def _run(handle):
+            t0 = time.perf_counter()
+            try:
+                return run(handle)
+            finally:
+                dt = time.perf_counter() - t0
+                if dt >= profiler.slow_callback_s:
+                    profiler.slow_callbacks += 1
+                    stamp = round(time.monotonic() - profiler._t0, 2)
+                    profiler._slow_log.write(f"{stamp:>9.2f}s {dt * 1000:>9.1f} ms  {profiler._describe(handle)}\n")
+        return _run
+
+    def _describe(self, handle) -> str:
+        # A task step's callback is bound to its task; name the site and where the coroutine stopped.
+        task = getattr(getattr(handle, "_callback", None), "__self__", None)
+        if not isinstance(task, asyncio.Task):
+            return repr(handle)
+        label = self._task_labels.get(task) or task.get_name()
+        coro = task.get_coro()
+        frame = getattr(coro, "cr_frame", None)
+        where = f" suspended at {_short(frame.f_code.co_filename)}:{frame.f_lineno}" if frame is not None else ""
+        return f"[{label}] {getattr(coro, '__qualname__', coro)}{where}"
+
+    @contextlib.asynccontextmanager
+    async def attach(self) -> AsyncIterator[None]:
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self._root_task = asyncio.current_task(loop)
+        previous_factory = loop.get_task_factory()
+        loop.set_task_factory(self._task_factory)
+        original_run = None
+        if _HANDLE_RUN_OK:
+            # Every callback, including each step of every task, goes through Handle._run.
+            original_run = asyncio.events.Handle._run
+            asyncio.events.Handle._run = self._timed_handle_run(original_run)
+        else:
+            self._slow_log.write(f"slow callback timing is not supported on Python {sys.version.split()[0]}\n")
+        monitor = loop.create_task(self._monitor(loop), name="profiler-monitor")
+        try:
+            yield
+        finally:
+            monitor.cancel()
+            if original_run is not None:
+                asyncio.events.Handle._run = original_run
+            loop.set_task_factory(previous_factory)
+            self._loop = None
+
+    # -- lifecycle --------------------------------------------------------
+
+    def start(self) -> None:
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self._t0 = time.monotonic()
+        self._slow_log = (self.out_dir / "asyncio.log").open("w", encoding="utf-8")
+        tracemalloc.start(self.memory_frames)
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Dict[str, Any]:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._check_memory()
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = self._peak_snapshot
+        tracemalloc.stop()
+        self._slow_log.close()
+        self._write_cpu()
+        if snapshot is not None:
+            self._write_memory(snapshot)
+        summary = self._summary(peak)
+        (self.out_dir / "summary.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+        return summary
+
+    def _write_cpu(self) -> None:
+        with (self.out_dir / "cpu.collapsed").open("w", encoding="utf-8") as f:
+            for stack, n in self.samples.most_common():
+                f.write(";".join(frame.replace(";", ":") for frame in stack) + f" {n}\n")
+
+    def _write_memory(self, snapshot: tracemalloc.Snapshot, top: int = 30) -> None:
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*"),
+        ))
+        with (self.out_dir / "memory.collapsed").open("w", encoding="utf-8") as f:
+            for stat in snapshot.statistics("traceback"):
+                # tracemalloc orders frames oldest first, as collapsed stacks expect.
+                frames = ";".join(f"{_short(fr.filename)}:{fr.lineno}" for fr in stat.traceback)
+                f.write(f"{frames} {stat.size}\n")
+        lines = [f"{'KiB':>10} {'blocks':>8}  location"]
+        for stat in snapshot.statistics("lineno")[:top]:
+            fr = stat.traceback[0]
+            lines.append(f"{stat.size / 1024:>10.1f} {stat.count:>8}  {_short(fr.filename)}:{fr.lineno}")
+        (self.out_dir / "memory_top.txt").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    def _summary(self, peak: int) -> Dict[str, Any]:
+        per_root: Counter = Counter()
+        for stack, n in self.samples.items():
+            per_root[stack[0]] += n
+        total = sum(per_root.values())
+        return {
+            "command": self.name,
+            "wall_s": round(time.monotonic() - self._t0, 2),
+            "interval_s": self.interval,
+            "samples": total,
+            "samples_by_task": {
+                k: {"samples": n, "share": round(n / total, 3)} for k, n in per_root.most_common()
+            },
+            "peak_traced_mb": round(peak / 1e6, 1),
+            "slow_callbacks": self.slow_callbacks if _HANDLE_RUN_OK else None,
+            "task_labels": _CURRENT_TASKS is not None,
+            "inline_parse": self.inline_parse,
+            "max_loop_lag_ms": max((p["lag_ms"] for p in self.timeline), default=None),
+            "max_tasks": max((p["tasks"] for p in self.timeline), default=None),
+            "loop_timeline": self.timeline,
+        }
+
+
+@contextlib.asynccontextmanager
+async def watch_loop() -> AsyncIterator[None]:
+    """Attach the active profiler to the running loop; a no-op without --profile."""
+    if _ACTIVE is None:
+        yield
+        return
+    async with _ACTIVE.attach():
+        yield
+
+
+@contextlib.contextmanager
+def session(out_root: Optional[str], name: str, inline_parse: bool = False) -> Iterator[Optional[Profiler]]:
+    """Profile the enclosed command into {out_root}/{name}-{UTC time}/; does nothing when out_root is None."""
+    global _ACTIVE
+    if out_root is None:
+        yield None
+        return
+    stamp = datetime.utcnow().strftime("%Y-%m-%dT%H%M%SZ")
+    profiler = Profiler(Path(out_root) / f"{name}-{stamp}", name, inline_parse=inline_parse)
+    _ACTIVE = profiler
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        _ACTIVE = None
+        summary = profiler.stop()
+        slow = summary["slow_callbacks"]
+        print(
+            f"Profile written to {profiler.out_dir}: {summary['samples']} samples, "
+            f"peak {summary['peak_traced_mb']} MB traced, "
+            + (f"{slow} slow callbacks" if slow is not None else "no callback timing on this Python")
+        )
@@ -1,9 +1,20 @@
 # rate_limit.py
+import asyncio
+import contextlib
+import random
 import time
 import threading
-import time
-import threading
-from typing import Optional
+from collections import deque
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from . import metrics
+from .log import get_logger
+logger = get_logger("rate_limit")
 
 class RateLimiter:
     """
@@ -54,3 +65,292 @@ class RateLimiter:
                 self.allowance -= tokens
                 return True
             return False
+
+
+class HostRateLimiter:
+    """
+    Asyncio rate limiter that spaces requests to each host by a jittered delay.
+
+    Every host tracks the earliest moment its next request may start. acquire()
+    reserves that slot synchronously and then sleeps exactly until it, so
+    concurrent callers queue up in order without polling or blocking the loop.
+    """
+    def __init__(self, delay_min: float = 0.0, delay_max: Optional[float] = None):
+        """
+        :param delay_min: Lower bound of the delay between requests to one host.
+        :param delay_max: Upper bound of the delay; defaults to delay_min (no jitter).
+        """
+        self.delay_min = delay_min
+        self.delay_max = delay_min if delay_max is None else max(delay_min, delay_max)
+        self._next_slot: Dict[str, float] = {}
+        self._crawl_delay: Dict[str, float] = {}
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    @classmethod
+    def from_site_config(cls, site_cfg: Dict[str, Any]) -> "HostRateLimiter":
+        """Build a limiter from the site's ``delay_s: {min, max}`` block."""
+        delay = site_cfg.get("delay_s") or {}
+        if isinstance(delay, (int, float)):
+            return cls(float(delay))
+        return cls(float(delay.get("min", 0.0)), float(delay.get("max", delay.get("min", 0.0))))
+
+    def set_crawl_delay(self, host: str, delay: Optional[float]) -> None:
+        """Enforce a robots.txt Crawl-delay for host; it acts as a floor on the jittered delay."""
+        if delay:
+            self._crawl_delay[host] = float(delay)
+        else:
+            self._crawl_delay.pop(host, None)
+
+    def use_robots(self, host: str, checker) -> None:
+        """Apply the crawl delay reported by a RobotsChecker, if any."""
+        self.set_crawl_delay(host, checker.crawl_delay())
+
+    def defer(self, url: str, seconds: float) -> None:
+        """Hold off the URL's host for at least `seconds`, e.g. to honour Retry-After."""
+        host = urlsplit(url).netloc if "://" in url else url
+        now = time.monotonic()
+        self._next_slot[host] = max(self._next_slot.get(host, now), now + seconds)
+
+    def interval(self, host: str) -> float:
+        delay = random.uniform(self.delay_min, self.delay_max)
+        return max(delay, self._crawl_delay.get(host, 0.0))
+
+    async def acquire(self, url: str) -> float:
+        """
+        Waits for the next slot on the URL's host.
+        :param url: Absolute URL or bare host name.
+        :return: Seconds spent waiting.
+        """
+        host = urlsplit(url).netloc if "://" in url else url
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self.interval(host)
+        wait = slot - now
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self._record(host, wait)
+        return wait
+
+    def _record(self, host: str, wait: float) -> None:
+        st = self.stats.setdefault(host, {"requests": 0, "wait_s": 0.0, "max_wait_s": 0.0})
+        st["requests"] += 1
+        st["wait_s"] += wait
+        st["max_wait_s"] = max(st["max_wait_s"], wait)
+
+    def total_wait(self) -> float:
+        return sum(st["wait_s"] for st in self.stats.values())
+
+
+# Responses that mean the host (or something in front of it) is overloaded.
+OVERLOAD_STATUSES = frozenset({429, 503, 504})
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given as delta-seconds or an HTTP date; None if absent or unparseable."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    now = time.time() if now is None else now
+    return max(0.0, when.timestamp() - now)
+
+
+class Outcome:
+    """What happened to one request, filled in by the caller inside AdaptiveConcurrency.slot()."""
+    def __init__(self, seq: int, t0: float):
+        self.seq = seq
+        self.t0 = t0
+        self.status: Optional[int] = None
+        self.error: Optional[BaseException] = None
+
+
+class _HostLimit:
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.in_flight = 0
+        self.started = 0
+        # Requests started before the last cut don't trigger another one, so a
+        # burst of failures from one window of requests cuts the limit once.
+        self.cut_at = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.latencies: Deque[float] = deque()
+        self.baseline: Optional[float] = None
+
+
+class AdaptiveConcurrency:
+    """
+    Per-host concurrency limit tuned by AIMD (additive increase,
+    multiplicative decrease), as TCP does for its congestion window.
+
+    Each successful request while the host is running at its limit grows the
+    limit by 1/limit, i.e. by about one slot per limit's worth of requests.
+    A 429/503/504, a timeout or a connection error multiplies it by `backoff`;
+    a window median latency above `latency_factor` times the host's healthy
+    (lowest seen, slowly decaying) median multiplies it by the gentler
+    `latency_backoff`. Medians are compared, not the p95, because web
+    latency has a long tail whatever the load: p95/p50 above 2 is normal
+    and would read as overload on every window. The limit always
+    stays within [min_limit, max_limit]. Retry-After is not handled here; the
+    FetchEngine passes it to the HostRateLimiter, which owns request timing.
+    """
+    def __init__(
+        self,
+        min_limit: int = 1,
+        max_limit: int = 1,
+        initial: Optional[int] = None,
+        backoff: float = 0.5,
+        latency_backoff: float = 0.8,
+        latency_factor: float = 2.0,
+        window: int = 40,
+    ):
+        """
+        :param min_limit: Hard floor on concurrent requests per host.
+        :param max_limit: Hard ceiling on concurrent requests per host.
+        :param initial: Starting limit; defaults to min_limit.
+        :param backoff: Factor applied on overload responses and errors.
+        :param latency_backoff: Factor applied when median latency degrades.
+        :param latency_factor: Window median / healthy median ratio that counts as degraded.
+        :param window: Recent latencies kept per host for the median.
+        """
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.initial = min(self.max_limit, max(self.min_limit, int(initial or self.min_limit)))
+        self.backoff = backoff
+        self.latency_backoff = latency_backoff
+        self.latency_factor = latency_factor
+        self.window = window
+        self._hosts: Dict[str, _HostLimit] = {}
+        self.cuts: Dict[str, int] = {}
+
+    @classmethod
+    def from_site_config(cls, site_cfg: Dict[str, Any]) -> "AdaptiveConcurrency":
+        """
+        ``concurrency: N`` keeps a fixed limit of N; a ``concurrency: {min,
+        max, initial}`` block makes it adaptive between min and max.
+        """
+        cfg = site_cfg.get("concurrency", 1)
+        if not isinstance(cfg, dict):
+            n = max(1, int(cfg or 1))
+            return cls(n, n)
+        return cls(
+            int(cfg.get("min", 1)),
+            int(cfg.get("max", cfg.get("min", 1))),
+            cfg.get("initial"),
+            float(cfg.get("backoff", 0.5)),
+            float(cfg.get("latency_backoff", 0.8)),
+            float(cfg.get("latency_factor", 2.0)),
+        )
+
+    @property
+    def adaptive(self) -> bool:
+        return self.max_limit > self.min_limit
+
+    def _host(self, host: str) -> _HostLimit:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostLimit(float(self.initial))
+        return state
+
+    def limit(self, host: str) -> int:
+        return int(self._host(host).limit)
+
+    def limits(self) -> Dict[str, int]:
+        return {host: int(state.limit) for host, state in self._hosts.items()}
+
+    @contextlib.asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[Outcome]:
+        """Hold one of the host's slots for a request; set status on the yielded Outcome before leaving."""
+        host = urlsplit(url).netloc if "://" in url else url
+        state = self._host(host)
+        t0 = time.monotonic()
+        await self._acquire(state)
+        metrics.observe("concurrency_wait_seconds", time.monotonic() - t0, host=host)
+        state.started += 1
+        outcome = Outcome(seq=state.started, t0=time.monotonic())
+        try:
+            yield outcome
+        except BaseException as e:
+            outcome.error = e
+            raise
+        finally:
+            state.in_flight -= 1
+            self._update(host, state, outcome)
+            self._wake(state)
+
+    async def _acquire(self, state: _HostLimit) -> None:
+        if state.in_flight < int(state.limit) and not state.waiters:
+            state.in_flight += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        state.waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Granted just as we were cancelled: hand the slot on.
+                state.in_flight -= 1
+                self._wake(state)
+            else:
+                state.waiters.remove(fut)
+            raise
+
+    def _wake(self, state: _HostLimit) -> None:
+        while state.waiters and state.in_flight < int(state.limit):
+            fut = state.waiters.popleft()
+            if not fut.done():
+                state.in_flight += 1
+                fut.set_result(None)
+
+    def _update(self, host: str, state: _HostLimit, outcome: Outcome) -> None:
+        if not self.adaptive:
+            return
+        err = outcome.error
+        if outcome.status in OVERLOAD_STATUSES or isinstance(err, (httpx.TimeoutException, httpx.NetworkError)):
+            reason = str(outcome.status) if outcome.status in OVERLOAD_STATUSES else type(err).__name__
+            self._cut(host, state, outcome, self.backoff, reason)
+            return
+        if err is not None or outcome.status is None:
+            # Cancelled, robots refusal, or a client-side bug: says nothing about the host.
+            return
+        if outcome.seq <= state.cut_at:
+            # Started under the old, higher limit; its latency says nothing about the new one.
+            return
+        latency = time.monotonic() - outcome.t0
+        state.latencies.append(latency)
+        if len(state.latencies) > self.window:
+            state.latencies.popleft()
+        if len(state.latencies) < self.window // 2:
+            # Not enough samples since the start or the last cut to judge the
+            # current limit, so hold it where it is.
+            return
+        ordered = sorted(state.latencies)
+        p50 = ordered[len(ordered) // 2]
+        if state.baseline is None:
+            state.baseline = p50
+        if p50 > self.latency_factor * state.baseline:
+            self._cut(host, state, outcome, self.latency_backoff, "latency")
+            return
+        # Follow improvements at once but regressions only slowly, so a
+        # creeping latency increase is still caught against the old median.
+        state.baseline = p50 if p50 < state.baseline else state.baseline + 0.01 * (p50 - state.baseline)
+        # Only grow when the limit was actually the constraint.
+        if state.in_flight + 1 >= int(state.limit):
+            state.limit = min(float(self.max_limit), state.limit + 1.0 / state.limit)
+
+    def _cut(self, host: str, state: _HostLimit, outcome: Outcome, factor: float, reason: str) -> None:
+        if outcome.seq <= state.cut_at or state.limit <= self.min_limit:
+            return
+        before = int(state.limit)
+        state.limit = max(float(self.min_limit), state.limit * factor)
+        state.cut_at = state.started
+        state.latencies.clear()
+        self.cuts[host] = self.cuts.get(host, 0) + 1
+        metrics.inc("concurrency_cuts", host=host, reason=reason)
+        logger.info(f"{host}: concurrency {before} -> {int(state.limit)} ({reason})")
@@ -0,0 +1,185 @@
+# retry.py
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from tenacity import AsyncRetrying, RetryCallState, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+from . import metrics
+from .log import get_logger
+logger = get_logger("retry")
+
+# Statuses worth asking again for: the host is overloaded, restarting or timed out.
+TRANSIENT_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+DEFAULT_RETRY = {
+    "attempts": 3,           # tries per request, including the first
+    "backoff_s": 1.0,        # first backoff; doubles per retry, plus up to backoff_s of jitter
+    "max_backoff_s": 30.0,
+    "breaker_failures": 5,   # consecutive transient failures that open a host's circuit
+    "breaker_reset_s": 30.0, # first open period; doubles each time a half-open probe fails
+    "breaker_max_reset_s": 600.0,
+    "final_pass": True,      # refetch transient failures once more at the end of the run
+    "final_pass_wait_s": 60.0,
+}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of sending a request to a host whose circuit is open."""
+
+
+def status_of(exc: BaseException) -> Optional[int]:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code
+    return getattr(exc, "status", None)
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Timeouts, dropped connections and overload statuses; anything else will fail the same way again."""
+    if isinstance(exc, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)):
+        return True
+    return status_of(exc) in TRANSIENT_STATUSES
+
+
+def retry_later(exc: BaseException) -> bool:
+    """Whether a URL that failed with exc belongs in the end-of-run retry queue."""
+    return isinstance(exc, CircuitOpen) or is_transient(exc)
+
+
+class _Circuit:
+    def __init__(self, reset_s: float):
+        self.state = "closed"
+        self.failures = 0
+        self.reset_s = reset_s
+        self.open_until = 0.0
+        self.probing = False
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker.
+
+    After `failures` consecutive transient failures a host's circuit opens and
+    requests to it fail fast with CircuitOpen. Once `reset_s` has passed the
+    circuit is half-open: a single probe request is let through, and its
+    result either closes the circuit or reopens it for twice as long (up to
+    `max_reset_s`). A response that is not transient, such as a 404, counts
+    as the host being healthy.
+    """
+    def __init__(self, failures: int = 5, reset_s: float = 30.0, max_reset_s: float = 600.0):
+        self.failures = max(1, failures)
+        self.reset_s = reset_s
+        self.max_reset_s = max(reset_s, max_reset_s)
+        self._hosts: Dict[str, _Circuit] = {}
+
+    @staticmethod
+    def _host(url: str) -> str:
+        return urlsplit(url).netloc if "://" in url else url
+
+    def _circuit(self, host: str) -> _Circuit:
+        circuit = self._hosts.get(host)
+        if circuit is None:
+            circuit = self._hosts[host] = _Circuit(self.reset_s)
+        return circuit
+
+    def check(self, url: str) -> None:
+        """Raise CircuitOpen unless a request to url's host may be sent now."""
+        host = self._host(url)
+        circuit = self._circuit(host)
+        if circuit.state == "closed":
+            return
+        if circuit.state == "open" and time.monotonic() >= circuit.open_until:
+            circuit.state = "half-open"
+        if circuit.state == "half-open" and not circuit.probing:
+            circuit.probing = True
+            logger.info(f"{host}: circuit half-open, probing with {url}")
+            return
+        raise CircuitOpen(f"circuit open for {host}")
+
+    def record(self, url: str, error: Optional[BaseException]) -> None:
+        """Report how a request that passed check() ended; error is None on success."""
+        host = self._host(url)
+        circuit = self._circuit(host)
+        transient = error is not None and is_transient(error)
+        responded = error is None or (status_of(error) is not None and not transient)
+        if responded:
+            if circuit.state != "closed":
+                logger.info(f"{host}: circuit closed")
+            circuit.state, circuit.failures, circuit.probing = "closed", 0, False
+            circuit.reset_s = self.reset_s
+        elif transient:
+            circuit.failures += 1
+            if circuit.state == "half-open":
+                circuit.reset_s = min(self.max_reset_s, circuit.reset_s * 2)
+                self._open(host, circuit)
+            elif circuit.state == "closed" and circuit.failures >= self.failures:
+                self._open(host, circuit)
+        else:
+            # Cancelled, refused by robots.txt and the like: no verdict on the host,
+            # but let another request be the half-open probe.
+            circuit.probing = False
+
+    def _open(self, host: str, circuit: _Circuit) -> None:
+        circuit.state, circuit.probing = "open", False
+        circuit.open_until = time.monotonic() + circuit.reset_s
+        metrics.inc("circuit_opened", host=host)
+        logger.warning(f"{host}: circuit open for {circuit.reset_s:.0f}s after {circuit.failures} failures")
+
+    def is_open(self, url: str) -> bool:
+        circuit = self._hosts.get(self._host(url))
+        return circuit is not None and circuit.state == "open"
+
+    def open_hosts(self) -> Dict[str, float]:
+        """Hosts whose circuit is open, with seconds until they may be probed again."""
+        now = time.monotonic()
+        return {h: max(0.0, c.open_until - now) for h, c in self._hosts.items() if c.state == "open"}
+
+
+class RetryPolicy:
+    """
+    Retries for one site's requests: transient failures only, with
+    exponential backoff and jitter, each attempt gated by the site's
+    CircuitBreaker. Built from the site's ``retry`` block over DEFAULT_RETRY.
+    """
+    def __init__(self, site: str, cfg: Optional[Dict[str, Any]] = None):
+        self.site = site
+        self.cfg = {**DEFAULT_RETRY, **(cfg or {})}
+        self.breaker = CircuitBreaker(
+            int(self.cfg["breaker_failures"]),
+            float(self.cfg["breaker_reset_s"]),
+            float(self.cfg["breaker_max_reset_s"]),
+        )
+
+    @classmethod
+    def from_site_config(cls, site_cfg: Dict[str, Any]) -> "RetryPolicy":
+        return cls(site_cfg.get("name", ""), site_cfg.get("retry"))
+
+    def _before_sleep(self, url: str, state: RetryCallState) -> None:
+        exc = state.outcome.exception()
+        metrics.inc("fetch_retries", site=self.site, error=status_of(exc) or type(exc).__name__)
+        logger.info(f"retrying {url} in {state.next_action.sleep:.1f}s after {exc!r}")
+
+    def retrying(self, url: str) -> AsyncRetrying:
+        backoff = float(self.cfg["backoff_s"])
+        return AsyncRetrying(
+            stop=stop_after_attempt(max(1, int(self.cfg["attempts"]))),
+            wait=wait_exponential_jitter(initial=backoff, max=float(self.cfg["max_backoff_s"]), jitter=backoff),
+            # No point sleeping for another attempt once the failure opened the circuit.
+            retry=retry_if_exception(lambda e: is_transient(e) and not self.breaker.is_open(url)),
+            before_sleep=lambda state: self._before_sleep(url, state),
+            reraise=True,
+        )
+
+    async def call(self, url: str, attempt):
+        """Run `await attempt()` for url under the breaker, retrying transient failures."""
+        async for state in self.retrying(url):
+            with state:
+                self.breaker.check(url)
+                try:
+                    result = await attempt()
+                except BaseException as e:
+                    self.breaker.record(url, e)
+                    raise
+                self.breaker.record(url, None)
+        return result
@@ -1,6 +1,19 @@
+import asyncio
 import re
+import time
 import urllib.robotparser
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from .log import get_logger
+from .retry import RetryPolicy
+logger = get_logger("robots")
+
+
+class RobotsDisallowed(Exception):
+    pass
 
 class RobotsChecker:
     """
@@ -24,3 +37,170 @@ class RobotsChecker:
         Returns the crawl-delay for the user-agent, or None if not specified.
         """
         return self.parser.crawl_delay(self.user_agent)
+
+
+def _compile_pattern(path: str):
+    """Compile a robots.txt path pattern; plain prefixes skip the regex engine."""
+    if "*" not in path and not path.endswith("$"):
+        return path
+    anchored = path.endswith("$")
+    body = re.escape(path[:-1] if anchored else path).replace(r"\*", ".*")
+    return re.compile(body + ("$" if anchored else ""))
+
+
+class RobotsRules:
+    """
+    Compiled robots.txt rules for a single user-agent.
+
+    Rules are ordered longest-first so the first match is the most specific one
+    (RFC 9309), with Allow winning ties. Each check is a walk over prefixes and
+    precompiled regexes rather than a re-parse of the file.
+    """
+    def __init__(self, rules: List[Tuple[str, bool]], delay: Optional[float] = None, sitemaps: Optional[List[str]] = None):
+        ordered = sorted((r for r in rules if r[0]), key=lambda r: (-len(r[0]), not r[1]))
+        self._rules = [(_compile_pattern(path), allow) for path, allow in ordered]
+        self._delay = delay
+        self.sitemaps = sitemaps or []
+
+    @classmethod
+    def allow_all(cls) -> "RobotsRules":
+        return cls([])
+
+    @classmethod
+    def disallow_all(cls) -> "RobotsRules":
+        return cls([("/", False)])
+
+    @classmethod
+    def parse(cls, text: str, user_agent: str) -> "RobotsRules":
+        """
+        Parse robots.txt text, keeping the groups that name user_agent's product
+        token (the part before "/", compared case-insensitively and exactly),
+        or the '*' groups when none do.
+        """
+        token = user_agent.split("/")[0].strip().lower()
+        groups: List[Tuple[List[str], List[Tuple[str, bool]], Optional[float]]] = []
+        sitemaps: List[str] = []
+        agents: List[str] = []
+        rules: List[Tuple[str, bool]] = []
+        delay: Optional[float] = None
+        in_rules = False
+        for raw in text.splitlines():
+            line = raw.split("#", 1)[0].strip()
+            if ":" not in line:
+                continue
+            field, value = (part.strip() for part in line.split(":", 1))
+            field = field.lower()
+            if field == "user-agent":
+                if in_rules:
+                    groups.append((agents, rules, delay))
+                    agents, rules, delay, in_rules = [], [], None, False
+                if value:
+                    agents.append(value.lower())
+            elif field in ("allow", "disallow"):
+                in_rules = True
+                rules.append((value, field == "allow"))
+            elif field == "crawl-delay":
+                in_rules = True
+                try:
+                    delay = float(value)
+                except ValueError:
+                    pass
+            elif field == "sitemap":
+                sitemaps.append(value)
+        if agents:
+            groups.append((agents, rules, delay))
+
+        specific = [g for g in groups if token in g[0] and token != "*"]
+        chosen = specific or [g for g in groups if "*" in g[0]]
+        merged = [r for g in chosen for r in g[1]]
+        delays = [g[2] for g in chosen if g[2] is not None]
+        return cls(merged, delays[0] if delays else None, sitemaps)
+
+    def can_fetch(self, url: str) -> bool:
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        for pattern, allow in self._rules:
+            if isinstance(pattern, str):
+                if path.startswith(pattern):
+                    return allow
+            elif pattern.match(path):
+                return allow
+        return True
+
+    def crawl_delay(self) -> Optional[float]:
+        return self._delay
+
+
+class RobotsCache:
+    """
+    Per-host cache of compiled robots.txt rules.
+
+    Each origin's robots.txt is fetched at most once per TTL, and concurrent
+    lookups for an origin share a single in-flight request. As RFC 9309 has
+    it, any 4xx (401 and 403 included) means there are no rules, cached as
+    allow-all for negative_ttl_s. Connection errors and 5xx responses are
+    retried through the caller's RetryPolicy; if they persist the error is
+    raised and nothing is cached, so the URLs that needed the rules fail
+    transiently and are requeued rather than being treated as disallowed.
+    """
+    def __init__(self, ttl_s: float = 86400.0, negative_ttl_s: Optional[float] = None):
+        self.ttl_s = ttl_s
+        self.negative_ttl_s = ttl_s if negative_ttl_s is None else negative_ttl_s
+        self._entries: Dict[Tuple[str, str], Tuple[float, RobotsRules]] = {}
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    async def get(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        user_agent: str,
+        retry: Optional[RetryPolicy] = None,
+    ) -> RobotsRules:
+        parts = urlsplit(url)
+        key = (f"{parts.scheme}://{parts.netloc}", user_agent)
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            rules, ttl = await self._fetch(client, key[0], user_agent, retry)
+            self._entries[key] = (time.monotonic() + ttl, rules)
+            fut.set_result(rules)
+            return rules
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            if not fut.done():
+                fut.cancel()
+            del self._inflight[key]
+
+    async def _fetch(
+        self,
+        client: httpx.AsyncClient,
+        origin: str,
+        user_agent: str,
+        retry: Optional[RetryPolicy],
+    ) -> Tuple[RobotsRules, float]:
+        robots_url = f"{origin}/robots.txt"
+
+        async def attempt() -> httpx.Response:
+            resp = await client.get(robots_url)
+            if resp.status_code >= 500:
+                resp.raise_for_status()
+            return resp
+
+        try:
+            resp = await (retry.call(robots_url, attempt) if retry is not None else attempt())
+        except httpx.HTTPError as e:
+            logger.warning(f"robots.txt unavailable for {origin}: {e}")
+            raise
+        if 400 <= resp.status_code < 500:
+            return RobotsRules.allow_all(), self.negative_ttl_s
+        return RobotsRules.parse(resp.text, user_agent), self.ttl_s
@@ -0,0 +1,149 @@
+# sitemap.py
+import re
+import zlib
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .log import get_logger
+logger = get_logger("sitemap")
+
+GZIP_MAGIC = b"\x1f\x8b"
+# Most inflated bytes fed to the XML parser at once. Sitemaps compress very
+# well, so one network chunk can otherwise inflate to megabytes of XML, and
+# the parser queues an event and element for every tag in it before read.
+INFLATE_STEP = 1 << 16
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_lastmod(value: Optional[str]) -> Optional[datetime]:
+    """Parse a W3C datetime from <lastmod>; naive values are taken as UTC."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+async def _stream_entries(engine, url: str) -> AsyncIterator[Tuple[str, str, Optional[str]]]:
+    """
+    Yield ("url" | "sitemap", loc, lastmod) from one sitemap document as it
+    downloads. Gzipped bodies are inflated incrementally, and each <url>
+    element is detached from the root once read, so memory stays flat
+    regardless of sitemap size.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root = None
+
+    def entries():
+        nonlocal root
+        for event, el in parser.read_events():
+            if event == "start":
+                if root is None:
+                    root = el
+                continue
+            kind = _local(el.tag)
+            if kind not in ("url", "sitemap"):
+                continue
+            loc = lastmod = None
+            for child in el:
+                name = _local(child.tag)
+                if name == "loc":
+                    loc = (child.text or "").strip()
+                elif name == "lastmod":
+                    lastmod = (child.text or "").strip()
+            # Clearing the entry alone would still leave an empty element per
+            # <url> hanging off the root; drop everything read so far.
+            el.clear()
+            del root[:]
+            if loc:
+                yield kind, loc, lastmod
+
+    async with engine.stream(url) as resp:
+        inflate = None
+        first = True
+        async for chunk in resp.aiter_bytes():
+            if first:
+                first = False
+                if chunk.startswith(GZIP_MAGIC):
+                    inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            if not inflate:
+                parser.feed(chunk)
+            else:
+                data = inflate.decompress(chunk, INFLATE_STEP)
+                while True:
+                    parser.feed(data)
+                    for entry in entries():
+                        yield entry
+                    if not inflate.unconsumed_tail:
+                        break
+                    data = inflate.decompress(inflate.unconsumed_tail, INFLATE_STEP)
+            for entry in entries():
+                yield entry
+        if inflate:
+            parser.feed(inflate.flush())
+        parser.close()
+        for entry in entries():
+            yield entry
+
+
+async def iter_sitemap_urls(engine, sitemap_urls: Iterable[str], max_sitemaps: int = 500) -> AsyncIterator[Tuple[str, Optional[str]]]:
+    """
+    Walk sitemaps and sitemap indexes breadth-first, yielding (loc, lastmod)
+    for every page entry. Nested sitemaps are fetched after the current
+    document finishes so only one response is open at a time.
+    """
+    queue: List[str] = list(sitemap_urls)
+    seen = set()
+    while queue and len(seen) < max_sitemaps:
+        url = queue.pop(0)
+        if url in seen:
+            continue
+        seen.add(url)
+        try:
+            async for kind, loc, lastmod in _stream_entries(engine, url):
+                if kind == "sitemap":
+                    queue.append(loc)
+                else:
+                    yield loc, lastmod
+        except Exception as e:
+            logger.warning(f"sitemap {url} failed: {e}")
+
+
+class SitemapFilter:
+    """
+    URL pattern filter for sitemap entries: a URL must match one of
+    `include` (when any are given) and none of `exclude`.
+    """
+    def __init__(self, include: Iterable[str] = (), exclude: Iterable[str] = ()):
+        self.include = [re.compile(p) for p in include]
+        self.exclude = [re.compile(p) for p in exclude]
+
+    def wanted(self, url: str) -> bool:
+        if self.include and not any(p.search(url) for p in self.include):
+            return False
+        return not any(p.search(url) for p in self.exclude)
+
+
+def changed_since(lastmod: Optional[str], captured_at: Optional[str]) -> bool:
+    """True unless <lastmod> is present and no newer than the previous capture."""
+    modified = parse_lastmod(lastmod)
+    captured = parse_lastmod(captured_at)
+    if modified is None or captured is None:
+        return True
+    return modified > captured
+
+
+def default_sitemaps(start_urls: Iterable[str], robots_sitemaps: Iterable[str] = ()) -> List[str]:
+    """Sitemaps named in robots.txt, else /sitemap.xml on each start URL's origin."""
+    found = list(dict.fromkeys(robots_sitemaps))
+    if found:
+        return found
+    origins = dict.fromkeys(f"{urlsplit(u).scheme}://{urlsplit(u).netloc}" for u in start_urls)
+    return [f"{o}/sitemap.xml" for o in origins]
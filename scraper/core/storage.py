@@ -1,10 +1,23 @@
 # storage.py
+import asyncio
 import os
+import gzip
+import hashlib
 import json
-from typing import Any, Iterable, Dict
+import mmap
+import time
+from datetime import datetime
+from typing import Any, Callable, Iterable, Iterator, Dict
 from pathlib import Path
 import orjson
 
+from . import metrics
+
+try:
+    import zstandard
+except ImportError:  # gzip is always available; zstd is used when installed
+    zstandard = None
+
 def save_json(data: Any, filepath: str) -> None:
     """
     Saves data as JSON to the specified filepath.
@@ -48,3 +61,238 @@ def write_jsonl(path: Path, rows: Iterable[Dict[str, Any]]):
         for r in rows:
             f.write(orjson.dumps(r))
             f.write(b"\n")
+
+
+def read_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Stream rows from a JSONL file, skipping blank lines.
+    A truncated final line left by an interrupted writer is ignored.
+    """
+    with Path(path).open("rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield orjson.loads(line)
+            except orjson.JSONDecodeError:
+                if line.endswith(b"\n"):
+                    raise
+                return
+
+
+class JsonlWriter:
+    """
+    Appends rows to a JSONL file in batches.
+
+    Rows are serialised as they arrive and written with a flush every
+    batch_size rows, so a crash loses at most one unflushed batch and the
+    file on disk is always a run of complete lines. on_flush runs after each
+    flush, e.g. to commit crawl state that refers to the rows just written.
+    """
+    def __init__(self, path: Path, batch_size: int = 50, on_flush: Callable[[], None] | None = None):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self._buf: list[bytes] = []
+        self._f = self.path.open("ab")
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self._buf.append(orjson.dumps(row) + b"\n")
+        if len(self._buf) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        # Processed files live at {root}/{site}/{date}.jsonl, so the parent names the site.
+        with metrics.timer("storage_write_seconds", site=self.path.parent.name, kind="jsonl"):
+            if self._buf:
+                self._f.write(b"".join(self._buf))
+                self._buf.clear()
+            self._f.flush()
+            if self.on_flush is not None:
+                self.on_flush()
+
+    def close(self) -> None:
+        if not self._f.closed:
+            self.flush()
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class RawStore:
+    """
+    Content-addressed, compressed store for raw pages of one site.
+
+    Blobs are keyed by the sha256 of their content, so a page that is
+    byte-identical to an earlier capture is written once and later days only
+    add a manifest line. Layout under data/raw/{site}/:
+
+      blobs/{sha[:2]}/{sha}.html.{gz|zst}   loose blobs (default)
+      packs/{date}.pack + packs/index.jsonl  append-only pack files (pack: true)
+      {date}/manifest.jsonl                  one line per captured URL
+    """
+    EXTENSIONS = {"gzip": "gz", "zstd": "zst"}
+
+    def __init__(self, site: str, root: str = "data/raw", codec: str = "gzip", pack: bool = False, level: int | None = None):
+        self.site = site
+        self.base = Path(root) / site
+        if codec == "zstd" and zstandard is None:
+            codec = "gzip"
+        self.codec = codec
+        self.level = level
+        self.pack = pack
+        self._index: Dict[str, Dict[str, Any]] | None = None
+        self._manifests: Dict[str, Any] = {}
+        self._maps: Dict[str, mmap.mmap] = {}
+
+    @classmethod
+    def from_config(cls, site: str, cfg: Dict[str, Any] | None) -> "RawStore":
+        cfg = cfg or {}
+        return cls(site, cfg.get("root", "data/raw"), cfg.get("codec", "gzip"), bool(cfg.get("pack", False)), cfg.get("level"))
+
+    def _compress(self, content: bytes) -> bytes:
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=self.level or 3).compress(content)
+        return gzip.compress(content, compresslevel=self.level or 6)
+
+    @staticmethod
+    def _decompress(data: bytes, codec: str) -> bytes:
+        if codec == "zstd":
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def blob_path(self, digest: str, codec: str | None = None) -> Path:
+        ext = self.EXTENSIONS[codec or self.codec]
+        return self.base / "blobs" / digest[:2] / f"{digest}.html.{ext}"
+
+    @property
+    def index(self) -> Dict[str, Dict[str, Any]]:
+        """sha256 -> {pack, offset, length, codec} for every packed blob."""
+        if self._index is None:
+            self._index = {}
+            idx_path = self.base / "packs" / "index.jsonl"
+            if idx_path.exists():
+                for row in read_jsonl(idx_path):
+                    self._index[row["sha256"]] = row
+        return self._index
+
+    def has(self, digest: str) -> bool:
+        if digest in self.index:
+            return True
+        return any(self.blob_path(digest, c).exists() for c in self.EXTENSIONS)
+
+    def put(self, date: str, url: str, content: bytes) -> str:
+        """Store content (if new) and record url -> blob in the day's manifest. Returns the digest."""
+        t0 = time.perf_counter()
+        digest = hashlib.sha256(content).hexdigest()
+        data = None if self.has(digest) else self._compress(content)
+        return self._store(date, url, content, digest, data, t0)
+
+    async def put_async(self, date: str, url: str, content: bytes) -> str:
+        """put() for the event loop: compression, the expensive part, runs in a worker thread."""
+        t0 = time.perf_counter()
+        digest = hashlib.sha256(content).hexdigest()
+        data = None if self.has(digest) else await asyncio.to_thread(self._compress, content)
+        return self._store(date, url, content, digest, data, t0)
+
+    def _store(self, date: str, url: str, content: bytes, digest: str, data: bytes | None, t0: float) -> str:
+        # Another put of the same page may have finished while this one was compressing.
+        if data is not None and not self.has(digest):
+            if self.pack:
+                self._append_pack(date, digest, data)
+            else:
+                path = self.blob_path(digest)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(path.suffix + ".tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+            metrics.inc("raw_bytes_stored", len(data), site=self.site)
+        else:
+            metrics.inc("raw_dedup_hits", site=self.site)
+        self._manifest(date).write(orjson.dumps({
+            "url": url,
+            "sha256": digest,
+            "size": len(content),
+            "captured_at": datetime.utcnow().isoformat() + "Z",
+        }) + b"\n")
+        metrics.observe("storage_write_seconds", time.perf_counter() - t0, site=self.site, kind="raw")
+        return digest
+
+    def _append_pack(self, date: str, digest: str, data: bytes) -> None:
+        pack_dir = self.base / "packs"
+        pack_dir.mkdir(parents=True, exist_ok=True)
+        pack_path = pack_dir / f"{date}.pack"
+        with pack_path.open("ab") as f:
+            offset = f.tell()
+            f.write(data)
+        row = {"sha256": digest, "pack": pack_path.name, "offset": offset, "length": len(data), "codec": self.codec}
+        with (pack_dir / "index.jsonl").open("ab") as f:
+            f.write(orjson.dumps(row) + b"\n")
+        self.index[digest] = row
+
+    def flush(self) -> None:
+        """Push buffered manifest lines to disk; call before committing state that relies on them."""
+        for f in self._manifests.values():
+            f.flush()
+
+    def _manifest(self, date: str):
+        f = self._manifests.get(date)
+        if f is None:
+            path = self.base / date / "manifest.jsonl"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            f = self._manifests[date] = path.open("ab")
+        return f
+
+    def _pack_map(self, name: str, end: int) -> mmap.mmap:
+        # Packs are mapped once per process; a pack that grew since is remapped.
+        m = self._maps.get(name)
+        if m is None or len(m) < end:
+            if m is not None:
+                m.close()
+            with (self.base / "packs" / name).open("rb") as f:
+                m = self._maps[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return m
+
+    def get(self, digest: str) -> bytes:
+        row = self.index.get(digest)
+        if row is not None:
+            start, end = row["offset"], row["offset"] + row["length"]
+            return self._decompress(self._pack_map(row["pack"], end)[start:end], row["codec"])
+        for codec in self.EXTENSIONS:
+            path = self.blob_path(digest, codec)
+            if path.exists():
+                return self._decompress(path.read_bytes(), codec)
+        raise KeyError(digest)
+
+    def manifest(self, date: str) -> Iterator[Dict[str, Any]]:
+        """Yield the day's manifest rows; the latest capture wins when a URL repeats."""
+        path = self.base / date / "manifest.jsonl"
+        if not path.exists():
+            return iter(())
+        latest = {row["url"]: row for row in read_jsonl(path)}
+        return iter(latest.values())
+
+    def previous_date(self, before: str) -> str | None:
+        """Most recent day before `before` that has a manifest."""
+        if not self.base.exists():
+            return None
+        days = sorted(p.parent.name for p in self.base.glob("*/manifest.jsonl") if p.parent.name < before)
+        return days[-1] if days else None
+
+    def carry(self, date: str, rows: Iterable[Dict[str, Any]]) -> None:
+        """Copy earlier manifest rows into the day's manifest for pages not refetched."""
+        f = self._manifest(date)
+        for row in rows:
+            f.write(orjson.dumps(row) + b"\n")
+
+    def close(self) -> None:
+        for f in self._manifests.values():
+            f.close()
+        self._manifests.clear()
+        for m in self._maps.values():
+            m.close()
+        self._maps.clear()
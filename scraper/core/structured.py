@@ -0,0 +1,154 @@
+# structured.py
+import json
+import re
+from html import unescape
+from typing import Any, Dict, Iterator, List, Optional
+
+# Helpers that turn structured product data (schema.org JSON-LD, Shopify's
+# product JSON) into the field dict consumed by adapters' parse_product.
+
+_LD_SCRIPT = re.compile(r"<script[^>]+application/ld\+json[^>]*>(.*?)</script\s*>", re.S | re.I)
+# Theme bugs seen in the wild: bare numbers with leading zeros (GTINs) and trailing commas.
+_LEADING_ZERO = re.compile(r'(:\s*)(0\d+)(\s*[,}\]])')
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+def loads_lenient(text: str) -> Any:
+    """json.loads that tolerates raw control characters and common theme JSON bugs; None if unparseable."""
+    try:
+        return json.loads(text, strict=False)
+    except ValueError:
+        pass
+    fixed = _TRAILING_COMMA.sub(r"\1", _LEADING_ZERO.sub(r'\1"\2"\3', text))
+    try:
+        return json.loads(fixed, strict=False)
+    except ValueError:
+        return None
+
+
+def _types(node: Dict[str, Any]) -> List[str]:
+    t = node.get("@type")
+    return t if isinstance(t, list) else [t]
+
+
+def _walk(node: Any) -> Iterator[Dict[str, Any]]:
+    if isinstance(node, list):
+        for item in node:
+            yield from _walk(item)
+    elif isinstance(node, dict):
+        yield node
+        if "@graph" in node:
+            yield from _walk(node["@graph"])
+
+
+def json_ld_product(html: str) -> Optional[Dict[str, Any]]:
+    """First schema.org Product (or ProductGroup) object embedded in the page, if any."""
+    for m in _LD_SCRIPT.finditer(html):
+        for node in _walk(loads_lenient(m.group(1))):
+            types = _types(node)
+            if "Product" in types or "ProductGroup" in types:
+                return node
+    return None
+
+
+def _first(value: Any) -> Any:
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _price(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        return float(str(value).replace(",", "").replace("$", "").strip())
+    except ValueError:
+        return None
+
+
+def _image_urls(value: Any) -> List[str]:
+    out = []
+    for item in value if isinstance(value, list) else [value]:
+        if isinstance(item, dict):
+            item = item.get("url") or item.get("contentUrl") or item.get("src")
+        if isinstance(item, str) and item:
+            out.append(item)
+    return out
+
+
+def _text(value: Any) -> Any:
+    # Liquid themes render JSON-LD strings through `escape`, so names arrive as 7&quot; etc.
+    return unescape(value) if isinstance(value, str) else value
+
+
+def fields_from_json_ld(node: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Map a JSON-LD Product to product fields. Offers may be a single Offer, a
+    list, or an AggregateOffer; ProductGroups use their first variant's offer.
+    """
+    offers = node.get("offers")
+    if offers is None and node.get("hasVariant"):
+        offers = _first(node["hasVariant"]).get("offers")
+    offer_list = offers if isinstance(offers, list) else [offers] if offers else []
+    in_stock = None
+    price = currency = sku = None
+    for offer in offer_list:
+        if not isinstance(offer, dict):
+            continue
+        available = "instock" in str(offer.get("availability", "")).lower().replace("_", "")
+        if price is None or (available and not in_stock):
+            price = _price(offer.get("price", offer.get("lowPrice")))
+            currency = offer.get("priceCurrency")
+            sku = _text(offer.get("sku"))
+        if "availability" in offer:
+            in_stock = bool(in_stock) or available
+    rating = node.get("aggregateRating") or {}
+    category = _text(node.get("category"))
+    return {
+        "title": _text(node.get("name")),
+        "price": price,
+        "currency": currency,
+        "sku": _text(node.get("sku")) or sku,
+        "images": _image_urls(node.get("image")),
+        "in_stock": in_stock,
+        "rating": _price(rating.get("ratingValue")),
+        "reviews_count": int(_price(rating.get("reviewCount") or rating.get("ratingCount")) or 0) or None,
+        "categories": [category] if isinstance(category, str) and category else [],
+    }
+
+
+def _money(value: Any) -> Optional[float]:
+    # products.json gives "12.99"; /products/<handle>.js gives integer cents.
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value / 100
+    return _price(value)
+
+
+def fields_from_shopify(product: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Map a Shopify product object, from /products.json or
+    /products/<handle>.js, to product fields. The first available variant
+    supplies price and SKU; the product is in stock if any variant is.
+    """
+    variants = product.get("variants") or []
+    chosen = next((v for v in variants if v.get("available")), variants[0] if variants else {})
+    images = []
+    for img in product.get("images") or []:
+        src = img.get("src") if isinstance(img, dict) else img
+        if src:
+            images.append("https:" + src if src.startswith("//") else src)
+    in_stock = None
+    if variants and any("available" in v for v in variants):
+        in_stock = any(v.get("available") for v in variants)
+    product_type = product.get("product_type") or product.get("type")
+    return {
+        "title": product.get("title"),
+        "price": _money(chosen.get("price")),
+        "currency": None,
+        "sku": chosen.get("sku") or None,
+        "images": images,
+        "in_stock": in_stock,
+        "rating": None,
+        "reviews_count": None,
+        "categories": [product_type] if product_type else [],
+    }
@@ -0,0 +1,165 @@
+# urls.py
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import tempfile
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+# Query parameters that only track campaigns or sessions; never part of a page's identity.
+TRACKING_PARAMS = (
+    r"utm_.*", "gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_gl",
+    "ref", "ref_", "srsltid", "_pos", "_sid", "_ss", "_psq", "_v",
+)
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+
+class UrlCanonicalizer:
+    """
+    Normalises URLs so variants of the same page compare equal.
+
+    Resolves relative and scheme-relative (//host/path) links against a base,
+    lowercases scheme and host, drops default ports and fragments, strips
+    tracking parameters (or keeps only `keep_params` when given), sorts the
+    remaining query, and removes a trailing slash from non-root paths.
+    Non-http(s) links such as mailto: and javascript: canonicalize to None.
+    """
+    def __init__(
+        self,
+        keep_params: Optional[Iterable[str]] = None,
+        strip_params: Iterable[str] = (),
+        keep_fragment: bool = False,
+        trailing_slash: bool = False,
+    ):
+        """
+        :param keep_params: If set, the only query parameters retained (regexes).
+        :param strip_params: Extra parameters to drop on top of TRACKING_PARAMS (regexes).
+        :param keep_fragment: Keep #fragments, for sites that route on them.
+        :param trailing_slash: Keep trailing slashes instead of stripping them.
+        """
+        self.keep = re.compile("|".join(f"(?:{p})" for p in keep_params)) if keep_params is not None else None
+        self.strip = re.compile("|".join(f"(?:{p})" for p in (*TRACKING_PARAMS, *strip_params)))
+        self.keep_fragment = keep_fragment
+        self.trailing_slash = trailing_slash
+
+    @classmethod
+    def from_site_config(cls, site_cfg: Dict[str, Any]) -> "UrlCanonicalizer":
+        cfg = site_cfg.get("canonical") or {}
+        return cls(
+            cfg.get("keep_params"),
+            cfg.get("strip_params", ()),
+            bool(cfg.get("keep_fragment", False)),
+            bool(cfg.get("trailing_slash", False)),
+        )
+
+    def __call__(self, url: str, base: Optional[str] = None) -> Optional[str]:
+        url = (url or "").strip()
+        if not url:
+            return None
+        if base:
+            url = urljoin(base, url)
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS or not parts.hostname:
+            return None
+        host = parts.hostname.lower()
+        if parts.port and str(parts.port) != DEFAULT_PORTS[scheme]:
+            host = f"{host}:{parts.port}"
+        path = re.sub(r"/{2,}", "/", parts.path) or "/"
+        if not self.trailing_slash and len(path) > 1:
+            path = path.rstrip("/") or "/"
+        params = [
+            (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+            if (self.keep.fullmatch(k) if self.keep is not None else not self.strip.fullmatch(k))
+        ]
+        query = urlencode(sorted(params))
+        fragment = parts.fragment if self.keep_fragment else ""
+        return urlunsplit((scheme, host, path, query, fragment))
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings, sized for `capacity` items at the
+    given false-positive rate (about 1.8 MB per million URLs at 0.1%).
+    Bit positions come from double hashing one blake2b digest.
+    """
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> range:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return range(h1, h1 + self.hashes * h2, h2)
+
+    def add(self, item: str) -> bool:
+        """Set the item's bits; returns True if any bit was previously unset (item definitely new)."""
+        bits, size = self.bits, self.size
+        new = False
+        for pos in self._positions(item):
+            pos %= size
+            mask, byte = 1 << (pos & 7), pos >> 3
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                new = True
+        return new
+
+    def __contains__(self, item: str) -> bool:
+        bits, size = self.bits, self.size
+        for pos in self._positions(item):
+            pos %= size
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class SeenSet:
+    """
+    Memory-compact set of visited URLs.
+
+    A BloomFilter answers "definitely new" for most URLs without touching
+    disk. Only Bloom hits (true repeats or false positives) are confirmed
+    against an exact SQLite table, which lives in a temporary file unless a
+    path is given, so memory stays flat at hundreds of thousands of links.
+    """
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001, path: Optional[str] = None):
+        self.bloom = BloomFilter(capacity, error_rate)
+        self._tmp = None
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="seen-", suffix=".sqlite")
+            os.close(fd)
+            self._tmp = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seen (url TEXT PRIMARY KEY)")
+        self.count = 0
+
+    def add(self, url: str) -> bool:
+        """Record url; returns True if it had not been seen before."""
+        if not self.bloom.add(url):
+            if self.conn.execute("SELECT 1 FROM seen WHERE url = ?", (url,)).fetchone():
+                return False
+        self.conn.execute("INSERT OR IGNORE INTO seen (url) VALUES (?)", (url,))
+        self.count += 1
+        return True
+
+    def __contains__(self, url: str) -> bool:
+        if url not in self.bloom:
+            return False
+        return self.conn.execute("SELECT 1 FROM seen WHERE url = ?", (url,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+        if self._tmp:
+            os.unlink(self._tmp)
+            self._tmp = None
@@ -6,6 +6,12 @@ import hashlib
 def content_hash(text: str) -> str:
     return hashlib.sha256(text.encode("utf-8", errors="ignore")).hexdigest()
 
+def make_dedupe_key(site: str, sku: Optional[str], url: str) -> str:
+    """Identity of a product across days; also usable on raw JSONL rows."""
+    if sku:
+        return f"{site}::{sku}"
+    return f"{site}::{content_hash(url)}"
+
 class Product(BaseModel):
     site: str
     url: str
@@ -22,12 +28,13 @@ class Product(BaseModel):
     captured_at: str = Field(default_factory=lambda: datetime.utcnow().isoformat() + "Z")
     hash: Optional[str] = None
     price_delta_vs_catalog: Optional[float] = None
+    catalog_sku: Optional[str] = None
+    catalog_match_method: Optional[str] = None
+    catalog_match_score: Optional[float] = None
     changes: Dict[str, Any] = Field(default_factory=dict)
 
     def dedupe_key(self) -> str:
-        if self.sku:
-            return f"{self.site}::{self.sku}"
-        return f"{self.site}::{content_hash(self.url)}"
+        return make_dedupe_key(self.site, self.sku, self.url)
 
     def ensure_hash(self):
         payload = f"{self.title}|{self.price}|{self.in_stock}|{','.join(self.images)}"
@@ -1,19 +1,34 @@
 import asyncio
+import time
 from datetime import datetime
 from pathlib import Path
 import importlib
 
-from .core import storage, diff, catalog
+from .core import storage, diff, catalog, fetch, sitemap, metrics, profiling
+from .core.history import History
+from .core.log import get_logger
+from .core.robots import RobotsCache
+from .core.parse_pool import ParseError, ParseStage
+from .core.browser import close_browser
+from .core.frontier import Frontier, FETCHED, PARSED, FAILED, SKIPPED
+from .core.prefilter import NotAProduct, Prefilter
+from .core.retry import retry_later
 from .models import Product
 import yaml
 import os
 
+logger = get_logger("runner")
+
 def load_config(brand: str | None = None):
     with open("config/config.yml", "r", encoding="utf-8") as f:
         cfg = yaml.safe_load(f)
     return cfg
 
-async def run_site(site_cfg, today: str, cat_map):
+def load_adapter_class(site_cfg):
+    if site_cfg.get("adapter"):
+        # An explicit adapter (e.g. "shopify") must exist; don't fall back silently.
+        module = importlib.import_module(f"scraper.sites.{site_cfg['adapter']}")
+        return getattr(module, "Adapter")
     module_name = f"scraper.sites.{site_cfg['name'].replace('.', '_')}"
     try:
         module = importlib.import_module(module_name)
@@ -21,21 +36,257 @@ async def run_site(site_cfg, today: str, cat_map):
         from .sites.example_site import ExampleSiteAdapter as Adapter
     else:
         Adapter = getattr(module, "Adapter", None) or getattr(module, "ExampleSiteAdapter")
-    adapter = Adapter(site_cfg)
-    urls = await adapter.discover_product_urls()
-    products: list[dict] = []
-    for url in urls:
-        html = await adapter.fetch_product(url)
-        prod = adapter.parse_product(html)
-        prod.url = url
-        prod.price_delta_vs_catalog = catalog.price_delta_vs_catalog(prod.sku, prod.price, cat_map)
-        products.append(prod.dict())
-        storage.write_raw(site_cfg["name"], today, url, html.encode(), "html")
-    storage.write_jsonl(storage.jsonl_path(site_cfg["name"], today), products)
+    return Adapter
+
+async def run_site(
+    site_cfg,
+    today: str,
+    cat_map,
+    budget: asyncio.Semaphore | None = None,
+    robots: RobotsCache | None = None,
+    parse_stage: ParseStage | None = None,
+    fresh: bool = False,
+) -> dict:
+    if isinstance(cat_map, catalog.Catalog):
+        cat_map.refresh()
+    Adapter = load_adapter_class(site_cfg)
+    engine = fetch.FetchEngine(site_cfg, budget=budget, robots=robots)
+    adapter = Adapter(site_cfg, engine=engine)
+    stage = parse_stage or ParseStage(workers=0)
+    raw = storage.RawStore.from_config(site_cfg["name"], site_cfg.get("raw_store"))
+    # Enough workers for the adaptive ceiling; the engine's per-host gate sets the actual limit.
+    concurrency = engine.gate.max_limit
+    # Pages between fetch start and JSONL write; this bounds HTML held in memory.
+    window = asyncio.Semaphore(max(concurrency, int(site_cfg.get("max_buffered_pages", 64))))
+    out_path = storage.jsonl_path(site_cfg["name"], today)
+    frontier = Frontier(site_cfg["name"], today)
+    if fresh:
+        frontier.reset()
+        out_path.unlink(missing_ok=True)
+
+    def commit():
+        # Manifest lines first, so a committed frontier never points at pages
+        # that replay and carry-forward cannot find.
+        raw.flush()
+        frontier.commit()
+
+    writer = storage.JsonlWriter(out_path, on_flush=commit)
+    written = failed = skipped = 0
+    # URLs that failed transiently or hit an open circuit, refetched once at the end.
+    requeue: list[str] = []
+    try:
+        resumed = frontier.discovery_done()
+        if not resumed:
+            with metrics.timer("discovery_seconds", site=site_cfg["name"]):
+                urls = await adapter.discover_product_urls()
+            urls, reasons = Prefilter.from_site_config(site_cfg, today).filter(urls)
+            if reasons:
+                skipped = sum(reasons.values())
+                logger.info(f"{site_cfg['name']}: prefilter skipped {skipped} URLs {dict(reasons)}")
+            lastmod = getattr(adapter, "lastmod", None)
+            if lastmod and (site_cfg.get("sitemap") or {}).get("incremental", True):
+                urls, written = carry_forward_unchanged(site_cfg["name"], today, urls, lastmod, cat_map, raw, writer, frontier)
+            frontier.add_discovered(urls)
+        # Anything already written today is skipped; earlier failures are retried.
+        urls = frontier.pending()
+        if resumed:
+            logger.info(f"{site_cfg['name']}: resuming with {len(urls)} URLs left for {today}")
+        # Rows are released in discovery order so output order does not depend
+        # on which fetch or parse batch finishes first.
+        ready: dict[int, dict | None] = {}
+        next_idx = 0
+
+        def emit(idx: int, row: dict | None):
+            nonlocal next_idx, written
+            ready[idx] = row
+            while next_idx in ready:
+                row = ready.pop(next_idx)
+                if row is not None:
+                    writer.write(row)
+                    frontier.mark(row["url"], PARSED)
+                    written += 1
+                next_idx += 1
+                window.release()
+
+        async def parse_batch(batch: list[tuple[int, str, bytes]]):
+            nonlocal failed
+            try:
+                rows = await stage.parse(site_cfg, [(url, content) for _, url, content in batch])
+            except Exception as e:
+                # The pool itself failed (e.g. a worker died); pages that merely
+                # fail to parse come back as ParseError rows instead.
+                logger.warning(f"{site_cfg['name']}: batch of {len(batch)} failed to parse: {e!r}")
+                rows = [ParseError(url, repr(e)) for _, url, _ in batch]
+            with metrics.timer("catalog_seconds", site=site_cfg["name"]):
+                catalog.annotate_rows([r for r in rows if not isinstance(r, ParseError)], cat_map)
+            for (idx, url, _), row in zip(batch, rows):
+                if isinstance(row, ParseError):
+                    logger.warning(f"parse failed for {url}: {row.message}")
+                    frontier.mark(url, FAILED, row.message)
+                    failed += 1
+                    row = None
+                emit(idx, row)
+
+        async def crawl(urls: list[str], last: bool):
+            nonlocal next_idx, failed, skipped
+            ready.clear()
+            next_idx = 0
+            parsing: set[asyncio.Task] = set()
+            async for done in fetch_concurrently(adapter, urls, concurrency, window):
+                batch = []
+                for idx, url, html in done:
+                    if isinstance(html, NotAProduct):
+                        frontier.mark(url, SKIPPED)
+                        skipped += 1
+                        emit(idx, None)
+                        continue
+                    if isinstance(html, Exception):
+                        if not last and retry_later(html):
+                            requeue.append(url)
+                        else:
+                            frontier.mark(url, FAILED, repr(html))
+                            failed += 1
+                        emit(idx, None)
+                        continue
+                    content = html.encode()
+                    await raw.put_async(today, url, content)
+                    frontier.mark(url, FETCHED)
+                    batch.append((idx, url, content))
+                for i in range(0, len(batch), stage.batch_size):
+                    parsing.add(asyncio.create_task(parse_batch(batch[i:i + stage.batch_size])))
+                while len(parsing) >= stage.max_pending:
+                    finished, parsing = await asyncio.wait(parsing, return_when=asyncio.FIRST_COMPLETED)
+                    for t in finished:
+                        t.result()
+            for t in parsing:
+                await t
+
+        retry_cfg = engine.retry.cfg
+        await crawl(urls, last=not retry_cfg["final_pass"])
+        if requeue:
+            # Give open circuits a chance to reach half-open before the last try.
+            wait = min(max(engine.retry.breaker.open_hosts().values(), default=0.0), float(retry_cfg["final_pass_wait_s"]))
+            logger.info(f"{site_cfg['name']}: refetching {len(requeue)} URLs that failed transiently in {wait:.0f}s")
+            await asyncio.sleep(wait)
+            await crawl(list(requeue), last=True)
+    finally:
+        writer.close()
+        frontier.close()
+        raw.close()
+        await adapter.aclose()
     prev_path = find_previous_jsonl(site_cfg["name"], today)
     if prev_path:
-        stats, changes = diff.compute_diff(list(storage.read_jsonl(prev_path)), products)
-        diff.write_diff_outputs(site_cfg["name"], today, stats, changes)
+        with metrics.timer("diff_seconds", site=site_cfg["name"]):
+            diff.write_diff_outputs(site_cfg["name"], today, prev_path, out_path)
+    history = History.from_config(site_cfg.get("history"))
+    if history is not None and out_path.exists():
+        # Off the event loop: other sites are still fetching.
+        with metrics.timer("storage_write_seconds", site=site_cfg["name"], kind="history"):
+            await asyncio.to_thread(history.write_day, site_cfg["name"], today, out_path)
+    return {
+        "products": written,
+        "failed": failed,
+        "skipped": skipped,
+        "requeued": len(requeue),
+        "rate_limit_wait_s": round(engine.limiter.total_wait(), 2),
+        "concurrency": engine.gate.limits(),
+    }
+
+def carry_forward_unchanged(
+    site: str,
+    today: str,
+    urls: list[str],
+    lastmod: dict,
+    cat_map,
+    raw: storage.RawStore,
+    writer: storage.JsonlWriter,
+    frontier: Frontier,
+) -> tuple[list[str], int]:
+    """
+    Split sitemap URLs into those to fetch today and those whose <lastmod> is
+    no newer than their last capture. Unchanged pages keep the previous day's
+    row and manifest entry, copied into today's outputs so the diff and the
+    next incremental run still see them. Returns (urls to fetch, rows carried).
+    """
+    prev_date = raw.previous_date(today)
+    prev_path = storage.jsonl_path(site, prev_date) if prev_date else None
+    if prev_path is None or not prev_path.exists():
+        return urls, 0
+    captures = {row["url"]: row for row in raw.manifest(prev_date)}
+    unchanged = {
+        u for u in urls
+        if u in captures and not sitemap.changed_since(lastmod.get(u), captures[u].get("captured_at"))
+    }
+    # URLs already in today's frontier come from an interrupted earlier attempt;
+    # they are fetched normally rather than risk writing their row twice.
+    unchanged.difference_update(frontier.urls())
+    carried: set[str] = set()
+    chunk: list[dict] = []
+
+    def write_chunk():
+        with metrics.timer("catalog_seconds", site=site):
+            catalog.annotate_rows(chunk, cat_map)
+        frontier.add_discovered([row["url"] for row in chunk], complete=False)
+        for row in chunk:
+            writer.write(row)
+            frontier.mark(row["url"], PARSED)
+        chunk.clear()
+
+    for row in storage.read_jsonl(prev_path):
+        url = row.get("url")
+        if url in unchanged and url not in carried:
+            carried.add(url)
+            chunk.append(row)
+            if len(chunk) >= 500:
+                write_chunk()
+    write_chunk()
+    raw.carry(today, (captures[u] for u in carried))
+    writer.flush()
+    logger.info(f"{site}: {len(carried)} unchanged since {prev_date}, {len(urls) - len(carried)} to fetch")
+    return [u for u in urls if u not in carried], len(carried)
+
+async def fetch_concurrently(adapter, urls: list[str], concurrency: int, window: asyncio.Semaphore | None = None):
+    """
+    Fetch urls with up to `concurrency` requests in flight.
+    Yields lists of (index, url, html) holding every fetch completed since the
+    previous yield; html is the exception if the fetch raised. When `window` is given a
+    slot is taken before each fetch and the caller releases it once done with the page.
+    """
+    pending = iter(enumerate(urls))
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        while True:
+            if window is not None:
+                await window.acquire()
+            item = next(pending, None)
+            if item is None:
+                if window is not None:
+                    window.release()
+                return
+            idx, url = item
+            try:
+                html = await adapter.fetch_product(url)
+            except NotAProduct as e:
+                html = e
+            except Exception as e:
+                logger.warning(f"fetch failed for {url}: {e}")
+                html = e
+            results.put_nowait((idx, url, html))
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(urls)))]
+    try:
+        remaining = len(urls)
+        while remaining:
+            done = [await results.get()]
+            while not results.empty():
+                done.append(results.get_nowait())
+            remaining -= len(done)
+            yield done
+    finally:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
 
 def find_previous_jsonl(site: str, today: str) -> Path | None:
     base = Path("data/processed") / site
@@ -44,10 +295,119 @@ def find_previous_jsonl(site: str, today: str) -> Path | None:
     files = sorted(p for p in base.glob("*.jsonl") if p.stem < today)
     return files[-1] if files else None
 
-def run_all():
-    today = datetime.utcnow().strftime("%Y-%m-%d")
+async def run_site_isolated(
+    site_cfg,
+    today: str,
+    cat_map,
+    budget: asyncio.Semaphore,
+    robots: RobotsCache | None,
+    parse_stage: ParseStage,
+    timeout: float | None,
+    fresh: bool = False,
+) -> dict:
+    """Run one site, converting its failure or timeout into a summary entry instead of raising."""
+    t0 = time.monotonic()
+    result = {"site": site_cfg["name"], "status": "ok", "error": None}
+    try:
+        result.update(await asyncio.wait_for(run_site(site_cfg, today, cat_map, budget, robots, parse_stage, fresh), timeout))
+    except asyncio.TimeoutError:
+        result["status"] = "timeout"
+        logger.error(f"{site_cfg['name']} timed out after {timeout}s")
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = repr(e)
+        logger.exception(f"{site_cfg['name']} failed")
+    result["wall_s"] = round(time.monotonic() - t0, 2)
+    return result
+
+# Top-level config keys that act as defaults for every site.
+INHERITED_KEYS = ("raw_store", "history", "retry")
+
+def with_defaults(cfg: dict, site_cfg: dict) -> dict:
+    return {**{k: cfg[k] for k in INHERITED_KEYS if k in cfg}, **site_cfg}
+
+async def crawl_sites(sites: list[dict], cfg: dict, today: str, cat_map, fresh: bool = False) -> list[dict]:
+    """Schedule every site concurrently under a shared in-flight request budget."""
+    sites = [with_defaults(cfg, s) for s in sites]
+    budget = asyncio.Semaphore(int(cfg.get("max_in_flight", 16)))
+    timeout = cfg.get("site_timeout_s")
+    robots = RobotsCache(float(cfg.get("robots_ttl_s", 86400))) if cfg.get("respect_robots", True) else None
+    if profiling.inline_parse():
+        # Parse in-process so extraction shows up in the CPU profile.
+        cfg = {**cfg, "parse_workers": 0}
+    parse_stage = ParseStage.from_config(cfg)
+    try:
+        async with profiling.watch_loop():
+            tasks = [
+                asyncio.create_task(
+                    run_site_isolated(s, today, cat_map, budget, robots, parse_stage, timeout, fresh), name=s["name"]
+                )
+                for s in sites
+            ]
+            return await asyncio.gather(*tasks)
+    finally:
+        parse_stage.close()
+        if any(s.get("use_playwright") for s in sites):
+            await close_browser()
+
+def print_run_summary(results: list[dict]) -> None:
+    for r in sorted(results, key=lambda r: r["wall_s"], reverse=True):
+        line = f"[{r['status'].upper()}] {r['site']}: {r['wall_s']:.2f}s"
+        if "products" in r:
+            line += f", {r['products']} products, {r['failed']} failed, {r['skipped']} skipped, {r['requeued']} requeued, {r['rate_limit_wait_s']:.2f}s rate-limited"
+            if r.get("concurrency"):
+                line += ", concurrency " + " ".join(f"{host}={n}" for host, n in r["concurrency"].items())
+        if r["error"]:
+            line += f" ({r['error']})"
+        print(line)
+
+def write_metrics_report(cfg: dict, started: datetime, results: list[dict]) -> Path | None:
+    """
+    Write the run's metrics as JSON under metrics.report_dir, with a per-site
+    total of seconds spent in each stage, and refresh the Prometheus
+    textfile when metrics.prometheus_textfile is set.
+    """
+    mcfg = cfg.get("metrics") or {}
+    if not mcfg.get("enabled", True):
+        return None
+    # Summed over concurrent work, so these can exceed the site's wall time.
+    breakdown: dict[str, dict[str, float]] = {}
+    for name, series in metrics.REGISTRY.histograms.items():
+        for key, hist in series.items():
+            labels = dict(key)
+            stage = name.removesuffix("_seconds") + (f"[{labels['kind']}]" if "kind" in labels else "")
+            per_site = breakdown.setdefault(labels.get("site", ""), {})
+            per_site[stage] = round(per_site.get(stage, 0) + hist.total, 3)
+    path = Path(mcfg.get("report_dir", "data/metrics")) / f"{started.strftime('%Y-%m-%dT%H%M%SZ')}.json"
+    metrics.REGISTRY.write_json(path, {"sites": results, "stage_seconds": breakdown})
+    if mcfg.get("prometheus_textfile"):
+        metrics.REGISTRY.write_prometheus(Path(mcfg["prometheus_textfile"]))
+    return path
+
+def run_all(site: str = "all", fresh: bool = False):
+    started = datetime.utcnow()
+    today = started.strftime("%Y-%m-%d")
+    cfg = load_config()
+    cat_map = catalog.Catalog.from_config(cfg)
+    sites = [s for s in cfg["sites"] if site in ("all", s["name"])]
+    if not sites:
+        raise ValueError(f"Unknown site: {site}")
+    t0 = time.monotonic()
+    metrics.REGISTRY.reset()
+    results = asyncio.run(crawl_sites(sites, cfg, today, cat_map, fresh))
+    print_run_summary(results)
+    print(f"Run finished in {time.monotonic() - t0:.2f}s")
+    report = write_metrics_report(cfg, started, results)
+    if report is not None:
+        print(f"Metrics written to {report}")
+    return results
+
+def compact_history(site: str = "all", force: bool = False) -> int:
+    """Backfill the Parquet history from processed JSONL; returns the number of days written."""
     cfg = load_config()
-    cat_map = catalog.load_catalog(cfg.get("catalog_csv", ""))
-    loop = asyncio.get_event_loop()
-    for site_cfg in cfg["sites"]:
-        loop.run_until_complete(run_site(site_cfg, today, cat_map))
+    history = History.from_config(cfg.get("history"))
+    if history is None:
+        raise RuntimeError("history is disabled or pyarrow is not installed")
+    written = history.compact(sites=None if site == "all" else [site], force=force)
+    print(f"Compacted {written} site-days into {history.root}")
+    return written
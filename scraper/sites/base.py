@@ -16,3 +16,7 @@ class BaseSiteAdapter(ABC):
     @abstractmethod
     def parse_product(self, html_or_page) -> Product:
         pass
+
+    async def aclose(self) -> None:
+        """Release network resources held by the adapter."""
+        pass
@@ -1,67 +1,158 @@
 import asyncio
-from typing import List
+import heapq
+import itertools
+import re
+from typing import Dict, List, Optional
 from ..models import Product
-from ..core import parser, fetch, browser
+from ..core import parser, fetch, browser, prefilter, sitemap, urls
 from .base import BaseSiteAdapter
 from datetime import datetime
+from urllib.parse import urlsplit
 
 class ExampleSiteAdapter(BaseSiteAdapter):
     site_name = "example-shop-1.com"
 
-    def __init__(self, config):
+    def __init__(self, config, engine: fetch.FetchEngine | None = None):
         self.config = config
+        self.engine = engine or fetch.FetchEngine(config)
+        self.plan = parser.ExtractionPlan(config.get("selectors", {}))
+        self.pages: browser.PagePool | None = None
+        self.probe = prefilter.ProductProbe.from_site_config(config)
+        # Filled by sitemap discovery: url -> <lastmod>, used by the runner to
+        # skip pages unchanged since the previous capture.
+        self.lastmod: Dict[str, Optional[str]] | None = None
 
     async def discover_product_urls(self) -> List[str]:
-        urls = []
+        if self.config.get("discovery") == "sitemap":
+            return await self._discover_from_sitemaps()
+        return await self._discover_from_links()
+
+    async def _discover_from_links(self) -> List[str]:
+        """
+        Priority crawl from start_urls. Listing pages matching crawl.follow are
+        expanded up to crawl.max_depth, shallowest first and then by the order
+        of the pattern they matched, so runs visit pages in the same order.
+        Every link is canonicalized and checked against a SeenSet, so each
+        page is fetched at most once.
+        """
+        crawl = self.config.get("crawl") or {}
         max_pages = self.config.get("max_pages", None)
         max_urls = self.config.get("max_urls", None)
-        for i, url in enumerate(self.config["start_urls"], start=1):
-            try:
-                status, content, final_url = fetch.fetch_httpx(
-                    url, user_agent=self.config.get("user_agent", "Mozilla/5.0")
-                )
-            except Exception as e:
-                print(f"[WARN] Failed to fetch {url}: {e}")
-                continue
-            links = parser.all_attr(content.decode(), self.config["selectors"]["product_link"], "href", final_url)
-            urls.extend(links)
-            if max_pages and i >= max_pages:
-                break
-        urls = list(set(urls))
-        if max_urls:
-            urls = urls[:max_urls]
-        return urls
-
-    async def fetch_product(self, url: str) -> str:
+        max_depth = int(crawl.get("max_depth", 0))
+        follow = [re.compile(p) for p in crawl.get("follow", ())]
+        product_patterns = [re.compile(p) for p in crawl.get("product", ())]
+        listing_link = crawl.get("listing_link", "a")
+        canon = urls.UrlCanonicalizer.from_site_config(self.config)
+        hosts = {urlsplit(canon(u) or "").netloc for u in self.config["start_urls"]}
+        seen = urls.SeenSet(int(crawl.get("seen_capacity", 1_000_000)))
+        queue: list = []
+        seq = itertools.count()
+        for url in self.config["start_urls"]:
+            url = canon(url)
+            if url and seen.add(url):
+                heapq.heappush(queue, (0, 0, next(seq), url))
+        products: List[str] = []
+        fetched = 0
         try:
-            if self.config.get("use_playwright"):
-                async with browser.browser_context(user_agent=self.config.get("user_agent", "Mozilla/5.0")) as ctx:
-                    status, html, final_url = await fetch.fetch_playwright(ctx, url, user_agent=self.config.get("user_agent", "Mozilla/5.0"))
-                    return html.decode()
-            else:
+            while queue and not (max_pages and fetched >= max_pages) and not (max_urls and len(products) >= max_urls):
+                depth, _, _, page = heapq.heappop(queue)
+                fetched += 1
                 try:
-                    _, content, _ = fetch.fetch_httpx(url, user_agent=self.config.get("user_agent", "Mozilla/5.0"))
-                    return content.decode()
+                    status, content, final_url = await self.engine.fetch(page)
                 except Exception as e:
-                    print(f"[WARN] Failed to fetch {url}: {e}")
-                    return ""
-        except Exception as e:
-            print(f"[ERROR] Unexpected error fetching {url}: {e}")
-            return ""
+                    print(f"[WARN] Failed to fetch {page}: {e}")
+                    continue
+                html = content.decode(errors="replace")
+                for link in parser.all_attr(html, self.config["selectors"]["product_link"], "href"):
+                    link = canon(link, final_url)
+                    if not link or (product_patterns and not any(p.search(link) for p in product_patterns)):
+                        continue
+                    if any(p.search(link) for p in follow):
+                        continue
+                    if seen.add(link):
+                        products.append(link)
+                if depth >= max_depth or not follow:
+                    continue
+                for link in parser.all_attr(html, listing_link, "href"):
+                    link = canon(link, final_url)
+                    if not link or urlsplit(link).netloc not in hosts:
+                        continue
+                    rank = next((i for i, p in enumerate(follow) if p.search(link)), None)
+                    if rank is not None and seen.add(link):
+                        heapq.heappush(queue, (depth + 1, rank, next(seq), link))
+        finally:
+            seen.close()
+        if max_urls:
+            products = products[:max_urls]
+        return products
+
+    async def _discover_from_sitemaps(self) -> List[str]:
+        cfg = self.config.get("sitemap") or {}
+        start_urls = self.config["start_urls"]
+        sources = cfg.get("urls")
+        if not sources:
+            robots_maps = []
+            for url in start_urls:
+                robots_maps.extend(await self.engine.sitemaps(url))
+            sources = sitemap.default_sitemaps(start_urls, robots_maps)
+        filt = sitemap.SitemapFilter(cfg.get("include", ()), cfg.get("exclude", ()))
+        canon = urls.UrlCanonicalizer.from_site_config(self.config)
+        self.lastmod = {}
+        async for loc, lastmod in sitemap.iter_sitemap_urls(self.engine, sources):
+            loc = canon(loc)
+            if loc and loc not in self.lastmod and filt.wanted(loc):
+                self.lastmod[loc] = lastmod
+        found = list(self.lastmod)
+        max_urls = self.config.get("max_urls", None)
+        if max_urls:
+            found = found[:max_urls]
+        return found
+
+    async def fetch_product(self, url: str) -> str:
+        # Errors propagate so the runner can record the URL as failed, or
+        # requeue it when the failure was transient, rather than parse "".
+        if self.config.get("use_playwright"):
+            if self.pages is None:
+                self.pages = browser.PagePool(self.config)
+            status, html, final_url = await self.engine.fetch(url, via=self.pages.fetch)
+            return html.decode()
+        if self.probe is not None:
+            return await self._fetch_probed(url)
+        _, content, _ = await self.engine.fetch(url)
+        return content.decode()
+
+    async def _fetch_probed(self, url: str) -> str:
+        """Stream the page, abandoning it as soon as its <head> shows it is not a product."""
+        async with self.engine.stream(url) as resp:
+            body = bytearray()
+            decided = False
+            async for chunk in resp.aiter_bytes():
+                checked = len(body)
+                body += chunk
+                if not decided:
+                    verdict = self.probe.check(body, checked)
+                    if verdict is False:
+                        raise prefilter.NotAProduct(url)
+                    decided = verdict is True
+        return body.decode(errors="replace")
+
+    async def aclose(self) -> None:
+        if self.pages is not None:
+            await self.pages.aclose()
+        await self.engine.aclose()
 
     def parse_product(self, html: str) -> Product:
-        cfg = self.config["selectors"]
-        categories_val = parser.first_text(html, cfg.get("categories"))
+        fields = self.plan.extract(html)
         prod = Product(
             site=self.site_name,
             url="",
-            title=parser.first_text(html, cfg.get("title")),
-            price=self._parse_price(parser.first_text(html, cfg.get("price"))),
-            sku=parser.first_text(html, cfg.get("sku")),
-            images=parser.all_attr(html, cfg.get("images"), "src"),
-            in_stock=self._parse_stock(parser.first_text(html, cfg.get("in_stock")), cfg.get("stock_text_contains")),
-            stock_text=parser.first_text(html, cfg.get("in_stock")),
-            categories=[categories_val] if categories_val else [],
+            title=fields["title"],
+            price=self._parse_price(fields["price"]),
+            sku=fields["sku"],
+            images=fields["images"],
+            in_stock=self._parse_stock(fields["in_stock"], self.config["selectors"].get("stock_text_contains")),
+            stock_text=fields["in_stock"],
+            categories=[fields["categories"]] if fields["categories"] else [],
             captured_at=datetime.utcnow().isoformat() + "Z"
         )
         return prod.ensure_hash()
@@ -0,0 +1,135 @@
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+import orjson
+from ..models import Product
+from ..core import fetch, structured, urls
+from ..core.retry import retry_later, status_of
+from .example_site import ExampleSiteAdapter
+from datetime import datetime
+
+class ShopifyAdapter(ExampleSiteAdapter):
+    """
+    Adapter for Shopify storefronts that reads structured data before HTML.
+
+    Discovery pages through /products.json, which returns every product with
+    its variants, SKUs, prices and availability, and keeps each product's JSON
+    so fetch_product needs no request. URLs left over from an interrupted run
+    are fetched from /products/<handle>.js. If the store does not answer
+    products.json, discovery falls back to sitemaps or links and pages are
+    parsed from their JSON-LD Product block, then from the configured selectors.
+    """
+    PAGE_SIZE = 250
+    # Consecutive .js 404s before the endpoint is assumed to be disabled.
+    JS_MAX_FAILURES = 3
+
+    def __init__(self, config, engine: fetch.FetchEngine | None = None):
+        super().__init__(config, engine)
+        self.site_name = config.get("name", self.site_name)
+        # url -> product JSON from products.json, consumed by fetch_product.
+        self._products: Dict[str, bytes] = {}
+        self._js_ok = True
+        self._js_failures = 0
+
+    async def discover_product_urls(self) -> List[str]:
+        found = await self._discover_from_products_json()
+        if found is None:
+            print(f"[WARN] {self.site_name}: products.json unavailable, falling back to HTML discovery")
+            # A store that hides products.json hides /products/<handle>.js as well.
+            self._js_ok = False
+            return await super().discover_product_urls()
+        return found
+
+    async def _discover_from_products_json(self) -> Optional[List[str]]:
+        cfg = self.config.get("shopify") or {}
+        max_pages = int(cfg.get("max_pages", 100))
+        max_urls = self.config.get("max_urls", None)
+        canon = urls.UrlCanonicalizer.from_site_config(self.config)
+        origins = dict.fromkeys(f"{urlsplit(u).scheme}://{urlsplit(u).netloc}" for u in self.config["start_urls"])
+        found: List[str] = []
+        answered = False
+        for origin in origins:
+            for page in range(1, max_pages + 1):
+                try:
+                    _, content, _ = await self.engine.fetch(f"{origin}/products.json?limit={self.PAGE_SIZE}&page={page}")
+                    data = orjson.loads(content)
+                except Exception as e:
+                    if page > 1:
+                        print(f"[WARN] {origin}/products.json page {page} failed: {e}")
+                    break
+                products = data.get("products") if isinstance(data, dict) else None
+                if products is None:
+                    break
+                answered = True
+                for product in products:
+                    url = canon(f"{origin}/products/{product.get('handle', '')}")
+                    if url and product.get("handle") and url not in self._products:
+                        self._products[url] = orjson.dumps(product)
+                        found.append(url)
+                if len(products) < self.PAGE_SIZE or (max_urls and len(found) >= max_urls):
+                    break
+        if not answered:
+            return None
+        if max_urls:
+            found = found[:max_urls]
+        return found
+
+    async def fetch_product(self, url: str) -> str:
+        cached = self._products.pop(url, None)
+        if cached is not None:
+            return cached.decode()
+        if self._js_ok and "/products/" in urlsplit(url).path:
+            try:
+                _, content, _ = await self.engine.fetch(url + ".js")
+            except Exception as e:
+                if retry_later(e):
+                    # The host is struggling, not the .js endpoint; an HTML request now
+                    # would fail too. The runner requeues the URL for its final pass.
+                    raise
+                print(f"[WARN] {url}.js failed, fetching HTML instead: {e}")
+                if status_of(e) == 404:
+                    # Usually one deleted or renamed handle; only a run of them
+                    # says the endpoint itself is off.
+                    self._js_failures += 1
+                    if self._js_failures >= self.JS_MAX_FAILURES:
+                        print(f"[WARN] {self.site_name}: {self._js_failures} .js 404s in a row, fetching HTML from now on")
+                        self._js_ok = False
+            else:
+                text = content.decode()
+                if text.lstrip().startswith("{"):
+                    self._js_failures = 0
+                    return text
+                # A storefront page instead of product JSON: the endpoint is not served here.
+                print(f"[WARN] {self.site_name}: {url}.js did not return JSON, fetching HTML from now on")
+                self._js_ok = False
+        return await super().fetch_product(url)
+
+    def parse_product(self, html: str) -> Product:
+        if html.lstrip().startswith("{"):
+            data = structured.loads_lenient(html) or {}
+            fields = structured.fields_from_shopify(data.get("product", data))
+        else:
+            node = structured.json_ld_product(html)
+            if node is None:
+                return super().parse_product(html)
+            fields = structured.fields_from_json_ld(node)
+            if fields["title"] is None or fields["price"] is None:
+                fallback = super().parse_product(html)
+                for f in ("title", "price", "sku", "images"):
+                    fields[f] = fields[f] or getattr(fallback, f)
+        prod = Product(
+            site=self.site_name,
+            url="",
+            title=fields["title"],
+            price=fields["price"],
+            currency=fields["currency"] or self.config.get("currency"),
+            sku=fields["sku"],
+            images=fields["images"],
+            in_stock=fields["in_stock"],
+            rating=fields["rating"],
+            reviews_count=fields["reviews_count"],
+            categories=fields["categories"],
+            captured_at=datetime.utcnow().isoformat() + "Z"
+        )
+        return prod.ensure_hash()
+
+Adapter = ShopifyAdapter
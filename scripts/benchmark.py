@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the scraper's hot paths.
+
+Runs against the raw pages already archived under data/raw (legacy
+{date}/*.html files and RawStore blobs alike), optionally replicated
+--scale times, plus synthetic product rows for the diff and catalog
+benchmarks. No network access is needed.
+
+    python scripts/benchmark.py --out bench.json
+    python scripts/benchmark.py --out new.json --compare bench.json --threshold 0.10
+
+With --compare, any benchmark whose throughput drops by more than the
+threshold is reported and the script exits non-zero.
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scraper.core import catalog, diff, parser, storage  # noqa: E402
+from scraper.models import Product  # noqa: E402
+from scraper.runner import load_adapter_class, load_config  # noqa: E402
+
+
+def load_corpus(raw_root: Path, sites=None, limit=None):
+    """Return {site: [(url_or_name, html_bytes)]} from legacy files and RawStore manifests."""
+    corpus = {}
+    for site_dir in sorted(p for p in raw_root.iterdir() if p.is_dir()):
+        site = site_dir.name
+        if sites and site not in sites:
+            continue
+        pages = []
+        for path in sorted(site_dir.glob("*/*.html")):
+            data = path.read_bytes()
+            if data:
+                pages.append((path.name, data))
+        store = storage.RawStore(site, str(raw_root))
+        for manifest in sorted(site_dir.glob("*/manifest.jsonl")):
+            for row in store.manifest(manifest.parent.name):
+                try:
+                    pages.append((row["url"], store.get(row["sha256"])))
+                except KeyError:
+                    continue
+        if limit:
+            pages = pages[:limit]
+        if pages:
+            corpus[site] = pages
+    return corpus
+
+
+def site_configs():
+    try:
+        return {s["name"]: s for s in load_config().get("sites", [])}
+    except OSError:
+        return {}
+
+
+class Bench:
+    def __init__(self, repeat: int):
+        self.repeat = repeat
+        self.results = {}
+
+    def run(self, name, fn, ops, nbytes=None, setup=None):
+        """Time fn() repeat times and keep the best run; fn processes `ops` items (and `nbytes` bytes)."""
+        best = float("inf")
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            t0 = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - t0)
+        result = {"ops": ops, "seconds": round(best, 6), "ops_per_s": round(ops / best, 2) if best else None}
+        if nbytes is not None:
+            result["mb_per_s"] = round(nbytes / 1e6 / best, 2) if best else None
+        self.results[name] = result
+        line = f"{name:<40} {result['ops_per_s']:>12,.1f} ops/s"
+        if nbytes is not None:
+            line += f" {result['mb_per_s']:>9,.1f} MB/s"
+        print(line)
+
+
+@contextmanager
+def in_tmpdir():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            yield Path(tmp)
+        finally:
+            os.chdir(cwd)
+
+
+def synthetic_rows(n, site="bench.example", seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "site": site,
+            "url": f"https://{site}/products/item-{i}",
+            "title": f"Benchmark Product {i} {rng.choice(['Microscope', 'Camera', 'Slide Kit', 'Lamp'])}",
+            "price": round(rng.uniform(5, 2000), 2),
+            "sku": f"SKU-{i:06d}",
+            "images": [f"https://{site}/img/{i}.jpg"],
+            "in_stock": rng.random() > 0.2,
+            "categories": ["bench"],
+            "captured_at": "2026-01-01T00:00:00Z",
+        }
+        for i in range(n)
+    ]
+
+
+def mutate(rows, fraction, seed=1):
+    rng = random.Random(seed)
+    out = []
+    for row in rows:
+        row = dict(row)
+        r = rng.random()
+        if r < fraction / 2:
+            row["price"] = round(row["price"] * rng.uniform(0.8, 1.2), 2)
+        elif r < fraction:
+            row["in_stock"] = not row["in_stock"]
+        out.append(row)
+    return out
+
+
+def with_hash(rows):
+    return [Product(**r).ensure_hash().dict() for r in rows]
+
+
+def bench_parsing(bench, corpus, configs):
+    for site, pages in corpus.items():
+        htmls = [content.decode("utf-8", errors="replace") for _, content in pages]
+        nbytes = sum(len(c) for _, c in pages)
+        cfg = configs.get(site) or {"name": site, "selectors": {"title": "h1", "images": "img", "product_link": "a"}}
+        cfg = {**cfg, "name": site}
+        link_sel = (cfg.get("selectors") or {}).get("product_link") or "a"
+        bench.run(f"first_text[{site}]", lambda: [parser.first_text(h, "h1") for h in htmls], len(htmls), nbytes)
+        bench.run(f"all_attr[{site}]", lambda: [parser.all_attr(h, link_sel, "href") for h in htmls], len(htmls), nbytes)
+        adapter = load_adapter_class(cfg)(cfg)
+        bench.run(f"parse_product[{site}]", lambda: [adapter.parse_product(h) for h in htmls], len(htmls), nbytes)
+
+
+def bench_products(bench, rows):
+    bench.run("product_construct_hash", lambda: [Product(**r).ensure_hash() for r in rows], len(rows))
+
+
+def bench_storage(bench, rows, corpus):
+    pages = [(name, content) for site_pages in corpus.values() for name, content in site_pages]
+    nbytes = sum(len(c) for _, c in pages)
+    with in_tmpdir() as tmp:
+        out = tmp / "bench.jsonl"
+        bench.run("write_jsonl", lambda: storage.write_jsonl(out, rows), len(rows), setup=lambda: out.unlink(missing_ok=True))
+        if pages:
+            bench.run("write_raw", lambda: [storage.write_raw("bench", "2026-01-01", u, c) for u, c in pages], len(pages), nbytes)
+
+            def fresh_store():
+                store = storage.RawStore("bench", str(tmp / f"store-{time.perf_counter_ns()}"))
+                holder["store"] = store
+
+            holder = {}
+
+            def put_all():
+                store = holder["store"]
+                for u, c in pages:
+                    store.put("2026-01-01", u, c)
+                store.close()
+
+            bench.run("rawstore_put", put_all, len(pages), nbytes, setup=fresh_store)
+
+
+def bench_diff(bench, rows):
+    prev = with_hash(rows)
+    cur = with_hash(mutate(rows, 0.05))
+    with in_tmpdir() as tmp:
+        prev_path, cur_path = tmp / "prev.jsonl", tmp / "cur.jsonl"
+        storage.write_jsonl(prev_path, prev)
+        storage.write_jsonl(cur_path, cur)
+        nbytes = prev_path.stat().st_size + cur_path.stat().st_size
+        bench.run("diff_products", lambda: diff.diff_products(prev_path, cur_path, lambda rec: None), len(rows), nbytes)
+
+
+def bench_catalog(bench, rows, catalog_size):
+    with in_tmpdir() as tmp:
+        path = tmp / "catalog.csv"
+        with path.open("w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=["sku", "title", "price"])
+            w.writeheader()
+            for i in range(catalog_size):
+                w.writerow({"sku": f"SKU-{i:06d}", "title": f"Benchmark Product {i}", "price": f"{10 + i % 500}.99"})
+        cat = catalog.Catalog(str(path))
+        skus = [r["sku"] for r in rows]
+        bench.run("catalog_lookup", lambda: [cat.price_delta(s, 10.0) for s in skus], len(skus))
+        # Every fourth row has no SKU, so annotate falls through to the title matcher.
+        batch = [dict(r, sku=None) if i % 4 == 0 else dict(r) for i, r in enumerate(rows)]
+        bench.run("catalog_annotate", lambda: cat.annotate([dict(r) for r in batch]), len(batch))
+        # The runner annotates one parse batch at a time; per-call setup costs show up here.
+        size = 16  # ParseStage default batch_size
+        bench.run(
+            "catalog_annotate_batched",
+            lambda: [cat.annotate([dict(r) for r in batch[i:i + size]]) for i in range(0, len(batch), size)],
+            len(batch),
+        )
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Print throughput changes against a baseline file; returns the names that regressed."""
+    baseline = json.loads(Path(baseline_path).read_text())["results"]
+    regressed = []
+    print(f"\nvs {baseline_path} (threshold {threshold:.0%}):")
+    for name, res in results.items():
+        old = baseline.get(name)
+        if not old or not old.get("ops_per_s") or not res.get("ops_per_s"):
+            continue
+        change = res["ops_per_s"] / old["ops_per_s"] - 1
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressed.append(name)
+        print(f"{name:<40} {change:>+8.1%}{flag}")
+    return regressed
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline benchmarks over the raw HTML corpus")
+    ap.add_argument("--raw", default="data/raw", help="Raw page archive root")
+    ap.add_argument("--site", action="append", help="Only benchmark these sites (repeatable)")
+    ap.add_argument("--limit", type=int, help="Pages per site")
+    ap.add_argument("--scale", type=int, default=1, help="Replicate the corpus this many times")
+    ap.add_argument("--rows", type=int, default=20000, help="Synthetic product rows for diff/catalog/storage")
+    ap.add_argument("--catalog-size", type=int, default=50000)
+    ap.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; the best is kept")
+    ap.add_argument("--out", default="bench.json", help="Write results JSON here")
+    ap.add_argument("--compare", help="Baseline results JSON to compare against")
+    ap.add_argument("--threshold", type=float, default=0.10, help="Allowed throughput drop before failing")
+    args = ap.parse_args()
+
+    raw_root = Path(args.raw)
+    corpus = load_corpus(raw_root, args.site, args.limit) if raw_root.exists() else {}
+    if args.scale > 1:
+        corpus = {site: pages * args.scale for site, pages in corpus.items()}
+    rows = synthetic_rows(args.rows)
+    pages = sum(len(p) for p in corpus.values())
+    mb = sum(len(c) for p in corpus.values() for _, c in p) / 1e6
+    print(f"corpus: {pages} pages, {mb:.1f} MB from {len(corpus)} sites; {len(rows)} synthetic rows")
+
+    bench = Bench(args.repeat)
+    bench_parsing(bench, corpus, site_configs())
+    bench_products(bench, rows)
+    bench_storage(bench, rows, corpus)
+    bench_diff(bench, rows)
+    bench_catalog(bench, rows, args.catalog_size)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "corpus": {"pages": pages, "mb": round(mb, 2), "scale": args.scale, "rows": len(rows)},
+        "results": bench.results,
+    }
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f"\nwrote {args.out}")
+    if args.compare:
+        regressed = compare(bench.results, args.compare, args.threshold)
+        if regressed:
+            print(f"{len(regressed)} benchmark(s) regressed beyond {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
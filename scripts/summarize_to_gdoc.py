@@ -31,15 +31,22 @@ def load_service_account():
         "Missing credentials. Set GCP_CREDENTIALS_JSON (base64) or GOOGLE_APPLICATION_CREDENTIALS (file path)."
     )
 
-def read_jsonl(p: Path):
-    rows = []
+def count_products(site: str, d: str) -> int:
+    # Parquet footers carry the row count; otherwise count JSONL lines without decoding them.
+    # A partition older than its JSONL (the day was re-scraped or resumed since) is stale,
+    # by the same test History.compact uses.
+    parquet = Path("data/history") / f"site={site}" / f"date={d}" / "part-0.parquet"
+    p = Path("data/processed") / site / f"{d}.jsonl"
+    if parquet.exists() and (not p.exists() or parquet.stat().st_mtime >= p.stat().st_mtime):
+        try:
+            import pyarrow.parquet as pq
+            return pq.ParquetFile(parquet).metadata.num_rows
+        except ImportError:
+            pass
     if not p.exists():
-        return rows
+        return 0
     with p.open("rb") as f:
-        for line in f:
-            if line.strip():
-                rows.append(orjson.loads(line))
-    return rows
+        return sum(1 for line in f if line.strip())
 
 def latest_date(site_dir: Path) -> str | None:
     files = sorted(site_dir.glob("*.jsonl"))
@@ -59,8 +66,8 @@ def load_stats():
         d = latest_date(site_dir)
         if not d: 
             continue
-        rows = read_jsonl(site_dir / f"{d}.jsonl")
-        summary["totals"]["products"] += len(rows)
+        products = count_products(site, d)
+        summary["totals"]["products"] += products
 
         stats = {}
         diff_json = diffs_root / site / f"{d}.json"
@@ -71,7 +78,7 @@ def load_stats():
                 if k in stats:
                     summary["totals"][k] += int(stats.get(k, 0))
 
-        summary["sites"].append({"site": site, "date": d, "products": len(rows), "stats": stats})
+        summary["sites"].append({"site": site, "date": d, "products": products, "stats": stats})
     return summary
 
 def render_markdown(s):